@@ -4,13 +4,41 @@
 # StoredApplicationSettings lib by Joep Bos-Coenraad (github.com/JoepBC)
 #########################################################################
 
+import copy
 import json
+import marshal
 import atexit
 import re
 import os
-from appdirs import AppDirs
+import tempfile
+import threading
+import time
+try:
+	from collections.abc import MutableMapping
+except ImportError:
+	from collections import MutableMapping
+try:
+	import fcntl
+except ImportError:
+	# No advisory file locking (Windows).
+	fcntl = None
+
+__all__ = ["StoredApplicationSettings", "LayeredSettings", "VerboseWriter",
+	"SettingsBackend", "JsonSettingsBackend", "MarshalSettingsBackend", "SqliteSettingsBackend", "DbmSettingsBackend",
+	"SettingsFileLock"]
+
+# Process wide cache of parsed settings files: resolved path -> (file_signature, settings dictionary).
+# Objects reading the same file get a copy of one parsed dictionary (see copy_settings) until the file changes.
+parsed_settings = {}
+parsed_settings_lock = threading.Lock()
+# (application_name, author) -> user config dir, resolved by appdirs once per process.
+user_config_dirs = {}
+
+def copy_settings(settings):
+	''' Return a copy of a settings dictionary, including its lists and dictionaries, so changing the copy
+	    leaves the original alone. Most settings are strings and numbers, which are not copied. '''
+	return dict((key, copy.deepcopy(value) if isinstance(value, (list, dict)) else value) for key, value in settings.items())
 
-__all__ = ["StoredApplicationSettings", "VerboseWriter"]
 
 class VerboseWriter(object):
 	def __init__(self, verbose_level=1):
@@ -27,14 +55,390 @@ class VerboseWriter(object):
 			print(*args)
 
 
+def file_signature(filename):
+	''' Return (mtime, size, inode) of filename, or None if it doesn't exist. Settings files are
+	    replaced by a rename when written, which gives them a new inode. '''
+	try:
+		stat = os.stat(filename)
+	except OSError:
+		return None
+	return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class SettingsFileLock(object):
+	'''Advisory lock (fcntl.flock) on a lock file, to be used in a with statement. All processes
+	   using the same settings lock the same file. Does nothing where fcntl is not available, and
+	   shared (reading) locks do nothing when the lock file can't be created.'''
+
+	def __init__(self, filename, exclusive=True):
+		self.filename = filename
+		self.exclusive = exclusive
+		self.lockfile = None
+
+	def __enter__(self):
+		if fcntl is not None:
+			try:
+				self.lockfile = open(self.filename, 'a')
+			except OSError:
+				if self.exclusive:
+					raise
+				# A read only config directory: lock an existing lock file, or else read without a lock.
+				try:
+					self.lockfile = open(self.filename, 'r')
+				except OSError:
+					return self
+			fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self.lockfile is not None:
+			fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_UN)
+			self.lockfile.close()
+			self.lockfile = None
+
+
+class SettingsBackend(object):
+	'''Storage of the settings of a StoredApplicationSettings object. Backends with on_demand set
+	   read single keys when they are needed (get/keys) instead of the whole store at once (read_all),
+	   and write only the keys that changed.'''
+
+	on_demand = False
+
+	def __init__(self, filename):
+		self.filename = filename
+
+	def exists(self):
+		return os.path.exists(self.filename)
+
+	def lock(self, exclusive=True):
+		''' Return a SettingsFileLock shared by all processes using this store. '''
+		return SettingsFileLock(self.filename + ".lock", exclusive)
+
+	def signature(self):
+		''' Return (mtime, size, inode) of the store, or None if it doesn't exist. It changes when another
+		    process writes, so the settings only need to be read again when it does. '''
+		return file_signature(self.filename)
+
+	def read_all(self):
+		''' Return a dictionary with all stored settings. '''
+		raise NotImplementedError
+
+	def get(self, key):
+		''' Return the stored value of key, raise KeyError if it is not stored. '''
+		return self.read_all()[key]
+
+	def keys(self):
+		return list(self.read_all().keys())
+
+	def write(self, settings, dirty_keys):
+		''' Store the values of dirty_keys (the keys changed since the last write) in settings, the ones not in settings
+		    have been deleted. Keys stored by other processes are kept. Return all stored settings if they had to be
+		    read for this, None otherwise. '''
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+
+class JsonSettingsBackend(SettingsBackend):
+	'''The default backend: all settings in a single JSON file, read and written as a whole.
+	   Writes merge the changed keys into the current file while holding the lock.'''
+
+	binary = False
+
+	def load(self, infile):
+		return json.load(infile)
+
+	def dump(self, settings, outfile):
+		json.dump(settings, outfile)
+
+	def read_all(self):
+		with self.lock(exclusive=False):
+			return self.read_file()
+
+	def read_file(self):
+		''' Return the parsed settings file. The parsed settings are cached for the whole process, each
+		    call returns a copy of them, so the file is parsed only once until it changes. '''
+		path = os.path.realpath(self.filename)
+		signature = file_signature(path)
+		with parsed_settings_lock:
+			if path in parsed_settings and parsed_settings[path][0] == signature:
+				return copy_settings(parsed_settings[path][1])
+		with open(path, 'rb' if self.binary else 'r') as infile:
+			settings = self.load(infile)
+		with parsed_settings_lock:
+			parsed_settings[path] = (signature, copy_settings(settings))
+		return settings
+
+	def write(self, settings, dirty_keys):
+		with self.lock():
+			try:
+				stored_settings = self.read_file()
+			except FileNotFoundError:
+				stored_settings = {}
+			for key in dirty_keys:
+				if key in settings:
+					stored_settings[key] = settings[key]
+				else:
+					stored_settings.pop(key, None)
+			self.write_file(stored_settings)
+			path = os.path.realpath(self.filename)
+			with parsed_settings_lock:
+				parsed_settings[path] = (file_signature(path), copy_settings(stored_settings))
+		return stored_settings
+
+	def write_file(self, settings):
+		''' Write settings to a temporary file next to the settings file, then rename it. The rename
+		    is atomic, so a crash never leaves a truncated settings file behind. The file keeps its mode
+		    (a new one gets the mode open would give it), not the 0600 of the temporary file. '''
+		dirname, basename = os.path.split(self.filename)
+		try:
+			mode = os.stat(self.filename).st_mode & 0o7777
+		except FileNotFoundError:
+			umask = os.umask(0)
+			os.umask(umask)
+			mode = 0o666 & ~umask
+		fd, tmp_filename = tempfile.mkstemp(prefix="."+basename+".", suffix=".tmp", dir=dirname or None)
+		try:
+			os.chmod(tmp_filename, mode)
+			with os.fdopen(fd, 'wb' if self.binary else 'w') as outfile:
+				self.dump(settings, outfile)
+				outfile.flush()
+				os.fsync(outfile.fileno())
+			os.replace(tmp_filename, self.filename)
+		except:
+			os.remove(tmp_filename)
+			raise
+
+
+class MarshalSettingsBackend(JsonSettingsBackend):
+	'''Like the JSON backend, but in the binary format of the marshal module, which loads large settings
+	   about twice as fast. The format may change between Python versions; see export_settings for a
+	   JSON copy.'''
+
+	binary = True
+
+	def load(self, infile):
+		# Reading the file at once is much faster than marshal.load on the file.
+		return marshal.loads(infile.read())
+
+	def dump(self, settings, outfile):
+		marshal.dump(settings, outfile)
+
+
+class SqliteSettingsBackend(SettingsBackend):
+	'''Settings in an sqlite database, one row per key with its value in JSON. Keys are read on demand
+	   and every write of the changed keys is a single transaction.'''
+
+	on_demand = True
+
+	def __init__(self, filename):
+		SettingsBackend.__init__(self, filename)
+		self.connection = None
+		# The connection is shared with the write-behind thread.
+		self.thread_lock = threading.RLock()
+
+	def connect(self):
+		if self.connection is None:
+			import sqlite3
+			self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+			with self.connection:
+				self.connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+		return self.connection
+
+	def read_all(self):
+		with self.thread_lock:
+			rows = self.connect().execute("SELECT key, value FROM settings").fetchall()
+		return dict((key, json.loads(value)) for key, value in rows)
+
+	def get(self, key):
+		with self.thread_lock:
+			row = self.connect().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+		if row is None:
+			raise KeyError(key)
+		return json.loads(row[0])
+
+	def keys(self):
+		with self.thread_lock:
+			return [row[0] for row in self.connect().execute("SELECT key FROM settings")]
+
+	def write(self, settings, dirty_keys):
+		changed = [(key, json.dumps(settings[key])) for key in dirty_keys if key in settings]
+		deleted = [(key,) for key in dirty_keys if key not in settings]
+		with self.thread_lock:
+			connection = self.connect()
+			with connection:
+				connection.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", changed)
+				connection.executemany("DELETE FROM settings WHERE key = ?", deleted)
+
+	def close(self):
+		with self.thread_lock:
+			if self.connection is not None:
+				self.connection.close()
+				self.connection = None
+
+
+class DbmSettingsBackend(SettingsBackend):
+	'''Settings in a dbm database (whichever implementation the dbm module picks), values in JSON.
+	   Keys are read on demand; dbm has no transactions, the database is closed after every write.'''
+
+	on_demand = True
+
+	def __init__(self, filename):
+		SettingsBackend.__init__(self, filename)
+		self.db = None
+		self.opened_signature = None
+		self.thread_lock = threading.RLock()
+
+	def exists(self):
+		import dbm
+		return dbm.whichdb(self.filename) is not None
+
+	def signature(self):
+		# Depending on the implementation, dbm adds extensions to the filename.
+		return tuple(file_signature(self.filename + extension) for extension in ("", ".db", ".dat", ".dir"))
+
+	def open(self):
+		''' Return the database opened for reading, opened again when another process wrote to it
+		    (some dbm implementations keep the index in memory). It stays open, so dbm.gnu databases
+		    are opened without their reader lock, which would keep other processes from writing. '''
+		signature = self.signature()
+		if self.db is not None and signature != self.opened_signature:
+			self.close()
+		if self.db is None:
+			if not self.exists():
+				return {}
+			import dbm
+			flag = 'ru' if dbm.whichdb(self.filename) == "dbm.gnu" else 'r'
+			with self.lock(exclusive=False):
+				self.db = dbm.open(self.filename, flag)
+			self.opened_signature = signature
+		return self.db
+
+	def read_all(self):
+		with self.thread_lock:
+			db = self.open()
+			return dict((key.decode(), json.loads(db[key])) for key in db.keys())
+
+	def get(self, key):
+		with self.thread_lock:
+			return json.loads(self.open()[key.encode()])
+
+	def keys(self):
+		with self.thread_lock:
+			return [key.decode() for key in self.open().keys()]
+
+	def write(self, settings, dirty_keys):
+		import dbm
+		with self.thread_lock, self.lock():
+			# Written with a database of its own, on top of the latest index, and closed right away.
+			self.close()
+			db = dbm.open(self.filename, 'c')
+			try:
+				for key in dirty_keys:
+					if key in settings:
+						db[key.encode()] = json.dumps(settings[key])
+					elif key.encode() in db:
+						del db[key.encode()]
+			finally:
+				db.close()
+
+	def close(self):
+		with self.thread_lock:
+			if self.db is not None:
+				self.db.close()
+				self.db = None
+
+
+class LayeredSettings(MutableMapping):
+	'''The settings of a StoredApplicationSettings object, as a ChainMap-like
+	   view on three layers: its own settings (its settings file, loaded on
+	   first use or read per key from an on demand backend, and its updates),
+	   the settings of its base (only consulted when a key is missing in the
+	   layer above) and its default settings.
+	   Nothing is copied between the layers; writes go through update().'''
+
+	def __init__(self, owner):
+		self.owner = owner
+
+	def __getitem__(self, key):
+		owner = self.owner
+		try:
+			return owner.get_local(key)
+		except KeyError:
+			pass
+		if owner.base is not None:
+			try:
+				return owner.base.settings[key]
+			except KeyError:
+				pass
+		return owner.defaults[key]
+
+	def __setitem__(self, key, value):
+		self.owner.update(key, value)
+
+	def __delitem__(self, key):
+		owner = self.owner
+		owner.get_local(key)
+		with owner.settings_lock:
+			owner.local_settings.pop(key, None)
+			owner.dirty_keys.add(key)
+
+	def __contains__(self, key):
+		try:
+			self[key]
+		except KeyError:
+			return False
+		return True
+
+	def layers(self):
+		layers = [self.owner.local_keys()]
+		if self.owner.base is not None:
+			layers.append(self.owner.base.settings)
+		layers.append(self.owner.defaults)
+		return layers
+
+	def __iter__(self):
+		seen = set()
+		for layer in self.layers():
+			for key in layer:
+				if key not in seen:
+					seen.add(key)
+					yield key
+
+	def __len__(self):
+		return sum(1 for key in self)
+
+	def __repr__(self):
+		return repr(dict(self.items()))
+
+
 class StoredApplicationSettings(object):
 
 	def __init__(self, application_name=None, filename = None, application_developer="", use_local_path=False, 
 			config_file_prefix="default", config_file_suffix="-settings.conf", verbose_level=1, verbosewriter=None,
-			base=None, static_base_settings=False):
+			base=None, static_base_settings=False, write_behind_delay=None, write_behind_changes=None,
+			backend="json", refresh_interval=None):
 
 		self.v = verbosewriter if verbosewriter is not None else VerboseWriter(verbose_level)
 
+		# Set: The keys updated since the settings were loaded or last stored. Nothing is written when empty.
+		self.dirty_keys = set()
+		# Lock protecting self.settings and self.dirty_keys against a concurrent (write-behind) store.
+		self.settings_lock = threading.RLock()
+		# Write-behind: store in the background write_behind_delay seconds after the last of a burst of
+		# updates, or as soon as write_behind_changes keys have been updated. None: store on close only.
+		self.write_behind_delay = write_behind_delay
+		self.write_behind_changes = write_behind_changes
+		self.write_behind_timer = None
+		self.last_update_time = 0
+		# Float: Check whether other processes changed the stored settings at most every refresh_interval
+		# seconds when reading a setting (a stat call, the settings are only read again when they changed).
+		# None: only pick up their changes when storing.
+		self.refresh_interval = refresh_interval
+		self.last_refresh_time = 0
+		self.stored_signature = None
+
 		# String: The actual filename that will be used to store data
 		self.filename = filename
 		# Boolean: Should the file be stored at the pwd or in the user config dir?
@@ -43,29 +447,95 @@ class StoredApplicationSettings(object):
 		self.config_file_prefix = config_file_prefix
 		self.config_file_suffix = config_file_suffix
 
-		# Base is another StoredApplicationSettings object (or alike) whose settings will be loaded, and which is also affected when this object is updated.
+		# Base is another StoredApplicationSettings object (or alike) whose settings are used for the keys not set in this object,
+		# and which is also affected when this object is updated, unless static_base_settings is set.
 		self.base = base
 		self.static_base_settings = static_base_settings
 
 		self.set_application_name(application_name, application_developer)
 		# Create default settings dictionary
 		self.default_settings()
+		# Dictionary: The settings of this object itself (loaded from file and updated), on top of the base and the defaults.
+		self.defaults = self.settings
+		self.local_settings = {}
+		self.settings = LayeredSettings(self)
 		# In case of a base, add these settings too
 		self.add_base_settings()
 		# Define filenames for reading/writing settings
 		self.set_filenames()
 		# Make sure the directory exists
 		self.verify_config_dir()
-		# If present, load settings from self.user_settings_filename
-		self.load_settings()
+		# SettingsBackend: Where the settings are stored, a name from get_backend_classes() or a SettingsBackend object.
+		self.backend = self.create_backend(backend)
+		# If present, settings are loaded from self.user_settings_filename on first use (see ensure_loaded)
+		self.settings_loaded = False
 		atexit.register(self.close_settings)
 		self.store_settings_on_close = True
 
 	def update(self, key, value):
-		''' Store/overwrite setting, also in base settings if available and if base is not marked static. '''
+		''' Store/overwrite setting, also in base settings if available and if base is not marked static.
+		    Only the settings of this object itself and those of the base are written, nothing is copied
+		    between the layers. Only the keys passed here are stored (see store_settings): after changing
+		    a value in place, e.g. appending to a list, call mark_dirty. '''
+		self.ensure_loaded()
 		if not self.static_base_settings and not self.base == None:
 			self.base.update(key,value)
-		self.settings[key] = value
+		with self.settings_lock:
+			if key in self.local_settings and self.local_settings[key] == value:
+				return
+			self.local_settings[key] = value
+			self.dirty_keys.add(key)
+		if self.write_behind_delay is not None or self.write_behind_changes is not None:
+			self.schedule_write_behind()
+
+	def mark_dirty(self, key):
+		''' Store key at the next store, after its value has been changed in place. '''
+		value = self.settings[key]
+		with self.settings_lock:
+			self.local_settings[key] = value
+			self.dirty_keys.add(key)
+		if self.write_behind_delay is not None or self.write_behind_changes is not None:
+			self.schedule_write_behind()
+
+	def schedule_write_behind(self):
+		''' Coalesce updates into a single background store: after write_behind_delay seconds without
+		    updates, or right away when write_behind_changes keys are dirty. '''
+		with self.settings_lock:
+			self.last_update_time = time.time()
+			if self.write_behind_changes is not None and len(self.dirty_keys) >= self.write_behind_changes:
+				delay = 0
+			elif self.write_behind_delay is not None:
+				delay = self.write_behind_delay
+			else:
+				return
+			if self.write_behind_timer is not None:
+				if delay > 0:
+					# A flush is pending already, it will be postponed (see write_behind_flush).
+					return
+				self.write_behind_timer.cancel()
+			self.start_write_behind_timer(delay)
+
+	def start_write_behind_timer(self, delay):
+		self.write_behind_timer = threading.Timer(delay, self.write_behind_flush)
+		self.write_behind_timer.daemon = True
+		self.write_behind_timer.start()
+
+	def write_behind_flush(self):
+		with self.settings_lock:
+			if self.write_behind_delay is not None and len(self.dirty_keys) < (self.write_behind_changes or float("inf")):
+				remaining = self.last_update_time + self.write_behind_delay - time.time()
+				if remaining > 0:
+					# Updates arrived in the meantime, wait for the burst to end.
+					self.start_write_behind_timer(remaining)
+					return
+			self.write_behind_timer = None
+		self.store_settings(comment_level=2)
+
+	def cancel_write_behind(self):
+		with self.settings_lock:
+			if self.write_behind_timer is not None:
+				self.write_behind_timer.cancel()
+				self.write_behind_timer = None
 
 
 	def set_application_name(self, application_name, application_developer):
@@ -86,18 +556,113 @@ class StoredApplicationSettings(object):
 		self.settings = {}
 
 	def add_base_settings(self):
-		''' If base settings are present, add/overwrite them to the default settings values '''
-		if not self.base == None:
-			for key, value in self.base.settings.items():
-				self.settings[key] = value
+		''' Base settings are not copied: self.settings looks them up in the base when they are not set in this object. '''
+		pass
+
+	def get_local(self, key):
+		''' Return the value of key in the settings of this object itself, raise KeyError if it isn't set there. '''
+		self.ensure_loaded()
+		self.check_refresh()
+		with self.settings_lock:
+			if key in self.local_settings:
+				return self.local_settings[key]
+			if not self.backend.on_demand or key in self.dirty_keys:
+				# Not stored, or deleted since the last store.
+				raise KeyError(key)
+		value = self.backend.get(key)
+		with self.settings_lock:
+			return self.local_settings.setdefault(key, value)
+
+	def local_keys(self):
+		''' Return the keys set in this object itself. '''
+		self.ensure_loaded()
+		self.check_refresh()
+		with self.settings_lock:
+			keys = list(self.local_settings)
+			if not self.backend.on_demand:
+				return keys
+			deleted = self.dirty_keys.difference(self.local_settings)
+		local = set(keys)
+		return keys + [key for key in self.backend.keys() if key not in local and key not in deleted]
+
+	def check_refresh(self):
+		if self.refresh_interval is not None and time.time() - self.last_refresh_time >= self.refresh_interval:
+			self.refresh_settings()
+
+	def refresh_settings(self):
+		''' Pick up the settings stored by other processes, if the store changed since it was last read or written. '''
+		self.last_refresh_time = time.time()
+		signature = self.backend.signature()
+		if signature == self.stored_signature:
+			return
+		self.stored_signature = signature
+		if self.backend.on_demand:
+			# Forget the values read so far, they are read again on demand.
+			self.merge_settings(None)
+		elif signature is None:
+			self.merge_settings({})
+		else:
+			self.merge_settings(self.backend.read_all())
+		self.v.print(2, "Settings changed by another process read from", self.backend.filename)
+
+	def merge_settings(self, settings_dictionary):
+		''' Replace the settings of this object by those in settings_dictionary, except the ones changed in this
+		    process and not stored yet. settings_dictionary None: forget them (on demand backends). '''
+		with self.settings_lock:
+			if settings_dictionary is not None and not self.dirty_keys and not self.backend.on_demand:
+				self.local_settings = settings_dictionary
+				return
+			local_settings = self.local_settings
+			for key in list(local_settings):
+				if key not in self.dirty_keys and (settings_dictionary is None or key not in settings_dictionary):
+					del local_settings[key]
+			if settings_dictionary is not None:
+				for key, value in settings_dictionary.items():
+					if key not in self.dirty_keys:
+						local_settings[key] = value
+
+	def ensure_loaded(self):
+		''' Load the settings file (see load_settings) on the first use of the settings. '''
+		if self.settings_loaded:
+			return
+		self.settings_loaded = True
+		self.load_settings()
+		# The settings just loaded are in the file already.
+		with self.settings_lock:
+			self.dirty_keys = set()
 
 	def set_filenames(self):
 		''' Define the filenames used for loading and storing the application settings data '''
 		if self.filename == None:
 			self.filename = self.config_file_prefix+self.config_file_suffix
-		self.user_config_dirname = os.getcwd() if self.use_local_path else AppDirs(self.application_name, self.author).user_config_dir
+		self.user_config_dirname = os.getcwd() if self.use_local_path else self.get_user_config_dir()
 		self.user_settings_filename = os.path.join(self.user_config_dirname, self.filename);
 
+	def get_user_config_dir(self):
+		''' Return the user config dir of the application. appdirs is only imported here, when it is actually needed,
+		    and asked once per process for each application. '''
+		key = (self.application_name, self.author)
+		if key not in user_config_dirs:
+			from appdirs import AppDirs
+			user_config_dirs[key] = AppDirs(self.application_name, self.author).user_config_dir
+		return user_config_dirs[key]
+
+	def get_backend_classes(self):
+		''' Return a dictionary of backend names, with their SettingsBackend class and the extension
+		    added to the settings filename for their store. '''
+		return {
+			"json": (JsonSettingsBackend, ""),
+			"marshal": (MarshalSettingsBackend, ".marshal"),
+			"sqlite": (SqliteSettingsBackend, ".sqlite"),
+			"dbm": (DbmSettingsBackend, ".dbm"),
+		}
+
+	def create_backend(self, backend):
+		if isinstance(backend, SettingsBackend):
+			return backend
+		backend_class, extension = self.get_backend_classes()[backend]
+		return backend_class(self.user_settings_filename + extension)
+
 	def verify_config_dir(self):
 		''' Make sure that the user directory for the configuration file exists '''
 		if self.use_local_path:
@@ -105,34 +670,77 @@ class StoredApplicationSettings(object):
 		os.makedirs(self.user_config_dirname, exist_ok=True)
 
 	def load_settings(self):
-		''' If settings have been saved previously, load (and set) them now. '''
-		try:
-			fp = open(self.user_settings_filename, 'r')
-		except:
-			#Couldn't open file. That's OK. No settings loaded from file.
+		''' If settings have been saved previously, load them now; on demand backends are read per key instead.
+		    All backends only fill the settings of this object itself: self.settings looks up the base and the
+		    defaults for the other keys (see LayeredSettings), so nothing is copied between the layers. '''
+		self.migrate_settings()
+		self.stored_signature = self.backend.signature()
+		self.last_refresh_time = time.time()
+		settings_dictionary = None
+		if not self.backend.on_demand:
+			try:
+				settings_dictionary = self.backend.read_all()
+			except EnvironmentError:
+				#Couldn't open file. That's OK. No settings loaded from file.
+				return
+		self.merge_settings(settings_dictionary)
+		if settings_dictionary is not None:
+			self.v.print(1, ("Local" if self.use_local_path else "User"), "settings read from file", self.backend.filename)
+
+	def migrate_settings(self):
+		''' Copy the settings of an existing JSON settings file into a new backend store (when another
+		    backend is used), and rename the JSON file so it isn't migrated again. '''
+		if os.path.realpath(self.backend.filename) == os.path.realpath(self.user_settings_filename):
 			return
-		else:
-			with fp:
-				self.set_settings_from_file(fp)
+		json_backend = JsonSettingsBackend(self.user_settings_filename)
+		# Another process may be migrating the same file.
+		with json_backend.lock():
+			if self.backend.exists() or not json_backend.exists():
+				return
+			with open(self.user_settings_filename, 'r') as infile:
+				settings_dictionary = json.load(infile)
+			self.backend.write(settings_dictionary, set(settings_dictionary))
+			os.replace(self.user_settings_filename, self.user_settings_filename + ".migrated")
+		self.v.print(1, "Settings migrated from", self.user_settings_filename, "to", self.backend.filename)
 
-	def set_settings_from_file(self, infile):
-		''' Read JSON dictionary data from opened filehandler 'infile' and update the values in self.settings with its contents '''
-		settings_dictionary  = json.load(infile)
-		for key, value in settings_dictionary.items():
-			self.update(key,value)
-			# self.settings[key] = value #this was before "self.base" was implemented.
-		self.v.print(1, ("Local" if self.use_local_path else "User"), "settings read from file", self.user_settings_filename)
+	def export_settings(self, filename):
+		''' Write the settings of this object as a JSON settings file named filename. Useful with the marshal,
+		    sqlite and dbm backends. The filename is required: self.user_settings_filename would be migrated
+		    into the backend (and renamed) at the next run. '''
+		settings = dict((key, self.get_local(key)) for key in self.local_keys())
+		JsonSettingsBackend(filename).write_file(settings)
+		self.v.print(1, "Settings exported to", filename)
 
 	def close_settings(self):
 		''' This method is called upon closing the application '''
-		if self.store_settings_on_close:
+		self.cancel_write_behind()
+		if self.store_settings_on_close and (self.dirty_keys or not self.backend.exists()):
 			self.store_settings()
+		self.backend.close()
+
+	def store_settings(self, comment_level=1):
+		''' Store the settings of this object (not those of its base or the defaults) in its backend,
+		    by default in self.user_settings_filename using JSON serialisation. Only the keys changed in
+		    this process are written, on top of the settings stored by other processes. '''
+		self.ensure_loaded()
+		with self.settings_lock:
+			dirty_keys, self.dirty_keys = self.dirty_keys, set()
+			settings = dict((key, self.local_settings[key]) for key in dirty_keys if key in self.local_settings)
+		try:
+			stored_settings = self.write_settings_file(settings, dirty_keys)
+		except:
+			with self.settings_lock:
+				self.dirty_keys |= dirty_keys
+			raise
+		# Take over the changes of other processes read while merging.
+		self.stored_signature = self.backend.signature()
+		if stored_settings is not None:
+			self.merge_settings(stored_settings)
+		self.v.print(comment_level,"Current",self.application_name, "settings stored at '"+self.backend.filename+"'.")
+		self.v.print(comment_level,"Remove this file to reset to the default settings at a next run.")
 
-	def store_settings(self):
-		''' Store the settings in dictionary self.settings in self.user_settings_filename using JSON serialisation '''
-		with open(self.user_settings_filename, 'w') as outfile:
-			json.dump(self.settings, outfile)
-		self.v.print(1,"Current",self.application_name, "settings stored at '"+self.user_settings_filename+"'.")
-		self.v.print(1,"Remove this file to reset to the default settings at a next run.")
+	def write_settings_file(self, settings, dirty_keys):
+		''' Write settings using the backend (for the JSON backend an atomic replace of the whole file). '''
+		return self.backend.write(settings, dirty_keys)
 
 # End of StoredApplicationSettings
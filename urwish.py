@@ -7,10 +7,676 @@
 ###############################################################
 
 
-import urwid
+import importlib
+import itertools
+import json
+import csv
+import marshal
+import os
+import sys
+import threading
 import time
+from collections import OrderedDict, Counter, deque
+
+__all__ = ['UrwishWidgetsBase', 'UrwishField', 'UrwishFieldRegistry', 'UrwishStats', 'UrwishByteCounter', 'UrwishTable',
+	'UrwishTextBuffer', 'UrwishJournal', 'Urwish', 'UrwishTemplate', 'UrwishSession', 'compile_schema', 'load_schema']
+
+
+class LazyModule(object):
+	'''Stands in for a module that is imported on its first use. Importing
+	   urwid takes much longer than importing urwish, and is not needed by
+	   programs that only define forms, use fill/run_batch or exit early.
+	   After the import, the global name refers to the module itself.'''
+
+	def __init__(self, module_name):
+		self.module_name = module_name
+
+	def __getattr__(self, name):
+		module = importlib.import_module(self.module_name)
+		globals()[self.module_name] = module
+		return getattr(module, name)
+
+urwid = LazyModule("urwid")
+
+# Changes when the contents of compiled template files change, see load_schema.
+TEMPLATE_FORMAT = 1
+# Templates compiled or read by this process, by the hash of their schema.
+compiled_templates = {}
+
+
+def urwish_widgets():
+	''' Import (once) and return the urwish_widgets module, with the urwid based widget classes. '''
+	package = __name__.rpartition('.')[0]
+	return importlib.import_module(package + '.urwish_widgets' if package else 'urwish_widgets')
+
+
+def set_bracketed_paste_mode(screen, enable=True):
+	''' Ask the terminal to mark pasted text (ESC[200~ ... ESC[201~), which urwid reports as the keys
+	    "begin paste" and "end paste". Screens that don't write to a terminal are left alone. '''
+	if hasattr(screen, "write") and hasattr(screen, "flush"):
+		screen.write("\x1b[?2004h" if enable else "\x1b[?2004l")
+		screen.flush()
+
+
+class UrwishField(object):
+	'''The specification (and, after creation, the widget and result) of
+	   a single form field. Supports the dictionary-style access of the
+	   former widget_specs dictionaries: field["descr"], "res" in field,
+	   del field["urwidget"]. Unset attributes count as missing keys.'''
+	__slots__ = ("descr", "value", "type", "urwidget", "res", "selected", "default")
+
+	def __init__(self, descr="", value="", widget_type=None):
+		self.descr = descr
+		self.value = value
+		self.type = widget_type
+
+	def __getitem__(self, name):
+		try:
+			return getattr(self, name)
+		except (AttributeError, TypeError):
+			raise KeyError(name)
+
+	def __setitem__(self, name, value):
+		try:
+			setattr(self, name, value)
+		except (AttributeError, TypeError):
+			raise KeyError(name)
+
+	def __delitem__(self, name):
+		try:
+			delattr(self, name)
+		except (AttributeError, TypeError):
+			raise KeyError(name)
+
+	def __contains__(self, name):
+		return name in self.__slots__ and hasattr(self, name)
+
+	def get(self, name, default=None):
+		return getattr(self, name, default) if name in self.__slots__ else default
+
+	def keys(self):
+		return [name for name in self.__slots__ if hasattr(self, name)]
+
+	def __repr__(self):
+		return repr(dict((name, getattr(self, name)) for name in self.keys()))
+
+
+class UrwishFieldKeys(object):
+	'''Read-only, list-like view on the keys of an UrwishFieldRegistry, in order.
+	   Used as the widget_list of an Urwish form.'''
+	__slots__ = ("registry",)
+
+	def __init__(self, registry):
+		self.registry = registry
+
+	def __len__(self):
+		return len(self.registry.order)
+
+	def __iter__(self):
+		return iter(self.registry.order)
+
+	def __getitem__(self, position):
+		return self.registry.order[position]
+
+	def __contains__(self, key):
+		return key in self.registry.fields
+
+	def index(self, key):
+		return self.registry.position(key)
+
+	def __repr__(self):
+		return repr(self.registry.order)
+
+
+class UrwishFieldRegistry(object):
+	'''Ordered registry of the fields of a form: maps widget keys to
+	   UrwishField records (like a dictionary) and keeps their order (see
+	   key_list). Membership tests and keyed lookups are O(1). Positional
+	   lookups use the order list; the key -> position index is kept up to
+	   date when appending, and rebuilt once after inserting or removing
+	   fields elsewhere.'''
+
+	def __init__(self):
+		self.fields = {}
+		self.order = []
+		self.positions = {}
+		self.key_list = UrwishFieldKeys(self)
+		self.auto_keys = itertools.count(1)
+
+	def new_key(self):
+		''' Return an unused key for a field that was added without a key. '''
+		key = "auto_" + str(next(self.auto_keys))
+		while key in self.fields:
+			key = "auto_" + str(next(self.auto_keys))
+		return key
+
+	def __len__(self):
+		return len(self.order)
+
+	def __iter__(self):
+		return iter(self.order)
+
+	def __contains__(self, key):
+		return key in self.fields
+
+	def __getitem__(self, key):
+		return self.fields[key]
+
+	def __setitem__(self, key, field):
+		''' Add a field at the end, or replace the record of an existing field (keeping its position). '''
+		if isinstance(field, dict):
+			field = self.field_from_dict(field)
+		if key not in self.fields:
+			self.append(key, field)
+		self.fields[key] = field
+
+	def __delitem__(self, key):
+		self.remove(key)
+
+	def field_from_dict(self, spec):
+		field = UrwishField(spec.get("descr", ""), spec.get("value", ""), spec.get("type"))
+		for name, value in spec.items():
+			field[name] = value
+		return field
+
+	def get(self, key, default=None):
+		return self.fields.get(key, default)
+
+	def keys(self):
+		return self.key_list
+
+	def values(self):
+		return [self.fields[key] for key in self.order]
+
+	def items(self):
+		return [(key, self.fields[key]) for key in self.order]
+
+	def append(self, key, field):
+		if self.positions is not None:
+			self.positions[key] = len(self.order)
+		self.order.append(key)
+		self.fields[key] = field
+
+	def insert(self, position, key, field):
+		if position >= len(self.order):
+			return self.append(key, field)
+		self.order.insert(position, key)
+		self.fields[key] = field
+		self.positions = None
+
+	def remove(self, key):
+		''' Remove a field, return its former position. '''
+		position = self.position(key)
+		del self.fields[key]
+		del self.order[position]
+		if position == len(self.order):
+			del self.positions[key]
+		else:
+			self.positions = None
+		return position
+
+	def position(self, key):
+		if self.positions is None:
+			self.positions = dict((a_key, position) for position, a_key in enumerate(self.order))
+		return self.positions[key]
+
+	def __repr__(self):
+		return repr(OrderedDict(self.items()))
+
+
+class UrwishStats(object):
+	'''Timings (in seconds) collected by an Urwish form with stats enabled,
+	   see Urwish.enable_stats. Every measurement name ("keypress", "render",
+	   "draw", "build:<widget_type>", "callback:<handler>") has a ring buffer
+	   holding its last capacity timings.'''
+
+	def __init__(self, capacity=1024):
+		self.capacity = capacity
+		self.timings = {}
+
+	def record(self, name, seconds):
+		timings = self.timings.get(name)
+		if timings is None:
+			timings = self.timings[name] = deque(maxlen=self.capacity)
+		timings.append(seconds)
+
+	def clear(self):
+		self.timings = {}
+
+	def percentile(self, sorted_timings, percent):
+		# Nearest-rank percentile of a sorted, non-empty list.
+		rank = max(0, min(len(sorted_timings) - 1, int(round(percent / 100.0 * len(sorted_timings))) - 1))
+		return sorted_timings[rank]
+
+	def summary(self, name):
+		''' Return count, mean, p50, p90, p99 and max of the timings of name (None if there are none). '''
+		timings = sorted(self.timings.get(name, ()))
+		if not timings:
+			return None
+		return OrderedDict([
+			("count", len(timings)),
+			("mean", sum(timings) / len(timings)),
+			("p50", self.percentile(timings, 50)),
+			("p90", self.percentile(timings, 90)),
+			("p99", self.percentile(timings, 99)),
+			("max", timings[-1]),
+		])
+
+	def summaries(self):
+		return OrderedDict((name, self.summary(name)) for name in sorted(self.timings))
+
+	def dump(self, outfile=None):
+		''' Write a line with the summary (in milliseconds) of every measurement to outfile (default: stderr). '''
+		outfile = outfile or sys.stderr
+		for name, summary in self.summaries().items():
+			outfile.write("%-28s n=%-6d mean=%.3f p50=%.3f p90=%.3f p99=%.3f max=%.3f ms\n" % (name,
+				summary["count"], summary["mean"] * 1000, summary["p50"] * 1000, summary["p90"] * 1000,
+				summary["p99"] * 1000, summary["max"] * 1000))
+
+	def __str__(self):
+		return "\n".join("%s: %s" % (name, dict(summary)) for name, summary in self.summaries().items())
+
+
+class UrwishByteCounter(object):
+	'''Stands in for the output file of the terminal screen and counts the
+	   bytes written to it: in total, and for each of the last capacity
+	   screen updates (between start_draw and end_draw). Used by Urwish forms
+	   in low bandwidth mode, see Urwish.enable_low_bandwidth.'''
+
+	def __init__(self, outfile, capacity=1024):
+		self.outfile = outfile
+		self.encoding = getattr(outfile, "encoding", None) or "utf-8"
+		self.total_bytes = 0
+		self.draw_bytes = deque(maxlen=capacity)
+		self.draw_start = None
+
+	def write(self, data):
+		if isinstance(data, str):
+			self.total_bytes += len(data.encode(self.encoding, "replace"))
+		else:
+			self.total_bytes += len(data)
+		return self.outfile.write(data)
+
+	def flush(self):
+		return self.outfile.flush()
+
+	def fileno(self):
+		# The screen asks the terminal size using the file descriptor.
+		return self.outfile.fileno()
+
+	def __getattr__(self, name):
+		return getattr(self.outfile, name)
+
+	def start_draw(self):
+		self.draw_start = self.total_bytes
+
+	def end_draw(self):
+		if self.draw_start is not None:
+			self.draw_bytes.append(self.total_bytes - self.draw_start)
+			self.draw_start = None
+
+	def summary(self):
+		''' Return the total number of bytes written, the number of screen updates counted and the
+		    mean, maximum and last number of bytes of those updates. '''
+		draws = list(self.draw_bytes)
+		return OrderedDict([
+			("total", self.total_bytes),
+			("draws", len(draws)),
+			("mean", sum(draws) / len(draws) if draws else 0),
+			("max", max(draws) if draws else 0),
+			("last", draws[-1] if draws else 0),
+		])
+
+	def dump(self, outfile=None):
+		outfile = outfile or sys.stderr
+		outfile.write("bytes written: total=%(total)d draws=%(draws)d mean=%(mean).1f max=%(max)d last=%(last)d\n" % self.summary())
+
+	def __str__(self):
+		return str(dict(self.summary()))
+
+
+class UrwishTable(object):
+	'''The rows of a "table" field: records of the same columns, each column
+	   being an "edit" (text) or a "checkbox" (bool) column. The rows are kept
+	   as tuples of cell values, never as widgets: the table editor only
+	   creates widgets for the rows on screen. Rows can be streamed from and
+	   to CSV (with a header row) or JSON lines using load and save.
+	   Iterating a table yields its rows (as they are when the iteration starts)
+	   as OrderedDicts by column name.'''
+
+	true_strings = ("1", "true", "yes", "y", "on", "x")
+
+	def __init__(self, columns, rows=None):
+		# columns: a list of names (edit columns) and/or (name, cell_type) pairs.
+		self.columns = [(column, "edit") if isinstance(column, str) else tuple(column) for column in columns]
+		self.names = [name for name, cell_type in self.columns]
+		# The function converting the cells of each column.
+		self.converters = []
+		for name, cell_type in self.columns:
+			if cell_type not in ("edit", "checkbox"):
+				raise ValueError("Unknown Urwish table cell type", name, cell_type, "Use 'edit' or 'checkbox'.")
+			self.converters.append(self.convert_bool_cell if cell_type == "checkbox" else self.convert_text_cell)
+		self.rows = []
+		# A copy of the list of rows, made on the first change (see restore).
+		self.original_rows = None
+		if rows is not None:
+			convert_row = self.convert_row
+			self.rows = [convert_row(record) for record in rows]
+
+	def __len__(self):
+		return len(self.rows)
+
+	def __getitem__(self, position):
+		return self.rows[position]
+
+	def __repr__(self):
+		return "UrwishTable(" + repr(self.names) + ", " + str(len(self.rows)) + " rows)"
+
+	def __iter__(self):
+		# The rows as they are now: editing or restoring the table afterwards doesn't change the iterator
+		# (e.g. the values of a record yielded by run_many). The rows are tuples, copying the list keeps them.
+		names, rows = self.names, list(self.rows)
+		return (OrderedDict(zip(names, row)) for row in rows)
+
+	def convert_row(self, record):
+		''' Return the row (tuple) for record, a dictionary by column name or a sequence of cells. String
+		    cells of checkbox columns are converted like CSV answers ("1", "yes", "x" and so on are True). '''
+		if hasattr(record, "get"):
+			cells = [record.get(name) for name in self.names]
+		else:
+			cells = list(record)
+			cells.extend([None] * (len(self.columns) - len(cells)))
+		return tuple(convert(cell) for convert, cell in zip(self.converters, cells))
+
+	def convert_text_cell(self, cell):
+		return "" if cell is None else str(cell)
+
+	def convert_bool_cell(self, cell):
+		if isinstance(cell, str):
+			return cell.strip().lower() in self.true_strings
+		return bool(cell)
+
+	def empty_row(self):
+		return self.convert_row([])
+
+	def append(self, record):
+		self.keep_original()
+		self.rows.append(self.convert_row(record))
+
+	def extend(self, records):
+		self.keep_original()
+		convert_row = self.convert_row
+		self.rows.extend(convert_row(record) for record in records)
+
+	def insert(self, position, record=None):
+		self.keep_original()
+		self.rows.insert(position, self.empty_row() if record is None else self.convert_row(record))
+
+	def __delitem__(self, position):
+		self.keep_original()
+		del self.rows[position]
+
+	def set_cell(self, position, column, value):
+		''' Set the cell in column (an index) of the row at position. '''
+		self.keep_original()
+		row = list(self.rows[position])
+		row[column] = value
+		self.rows[position] = tuple(row)
+
+	def keep_original(self):
+		if self.original_rows is None:
+			# The rows are tuples and never changed, a shallow copy keeps them.
+			self.original_rows = list(self.rows)
+
+	def restore(self):
+		''' Undo all changes since the table was created, or since the previous restore/keep_changes. '''
+		if self.original_rows is not None:
+			self.rows = self.original_rows
+			self.original_rows = None
+
+	def keep_changes(self):
+		self.original_rows = None
+
+	def load(self, infile, format="csv"):
+		''' Append the records in the opened file infile: CSV with a header row of column names ("csv") or
+		    JSON lines ("jsonl"), read one line at a time. Returns the table. '''
+		if format == "csv":
+			reader = csv.reader(infile)
+			header = next(reader, None)
+			if header is None:
+				return self
+			if header == self.names:
+				self.extend(reader)
+			else:
+				self.extend(dict(zip(header, cells)) for cells in reader)
+		elif format == "jsonl":
+			self.extend(json.loads(line) for line in infile if line.strip())
+		else:
+			raise ValueError("Unknown Urwish table format", format, "Use 'csv' or 'jsonl'.")
+		self.keep_changes()
+		return self
+
+	def save(self, outfile, format="csv"):
+		''' Write the rows to the opened file outfile, as CSV with a header row ("csv") or as JSON lines ("jsonl"). '''
+		if format == "csv":
+			writer = csv.writer(outfile)
+			writer.writerow(self.names)
+			writer.writerows(self.rows)
+		elif format == "jsonl":
+			names = self.names
+			for row in self.rows:
+				outfile.write(json.dumps(OrderedDict(zip(names, row))))
+				outfile.write("\n")
+		else:
+			raise ValueError("Unknown Urwish table format", format, "Use 'csv' or 'jsonl'.")
+
+
+class UrwishTextBuffer(object):
+	'''The text of a "textarea" field, kept as a list of lines (without their
+	   line ends). Changing a line replaces only that line, splitting and
+	   joining lines only moves the references in the list, so the cost of an
+	   edit does not depend on the size of the text. The text area only
+	   creates widgets for the lines on screen.'''
+
+	def __init__(self, text=""):
+		# text: a string, or an iterable of lines (e.g. an opened file).
+		if isinstance(text, str):
+			self.lines = text.split("\n")
+		else:
+			self.lines = [line.rstrip("\r\n") for line in text] or [""]
+		# A copy of the list of lines, made on the first change (see restore).
+		self.original_lines = None
+
+	def __len__(self):
+		return len(self.lines)
+
+	def __getitem__(self, position):
+		return self.lines[position]
+
+	def __iter__(self):
+		# The lines as they are now, like UrwishTable.
+		return iter(list(self.lines))
+
+	def __repr__(self):
+		return "UrwishTextBuffer(" + str(len(self.lines)) + " lines)"
+
+	def text(self):
+		return "\n".join(self.lines)
+
+	def set_line(self, position, line):
+		self.keep_original()
+		self.lines[position] = line
+
+	def split_line(self, position, column):
+		''' Break the line at position in two before column (pressing enter). '''
+		self.keep_original()
+		line = self.lines[position]
+		self.lines[position:position + 1] = [line[:column], line[column:]]
+
+	def join_lines(self, position):
+		''' Append the line after position to the line at position. '''
+		self.keep_original()
+		self.lines[position:position + 2] = [self.lines[position] + self.lines[position + 1]]
+
+	def insert_text(self, position, column, text):
+		''' Insert text (which may hold newlines) in the line at position before column. Returns the
+		    position and column at the end of the inserted text. '''
+		self.keep_original()
+		line = self.lines[position]
+		pieces = text.split("\n")
+		end_column = len(pieces[-1])
+		pieces[0] = line[:column] + pieces[0]
+		pieces[-1] = pieces[-1] + line[column:]
+		self.lines[position:position + 1] = pieces
+		return position + len(pieces) - 1, end_column
+
+	def keep_original(self):
+		if self.original_lines is None:
+			# The lines are strings and never changed, a shallow copy keeps them.
+			self.original_lines = list(self.lines)
+
+	def restore(self):
+		''' Undo all changes since the buffer was created, or since the previous restore/keep_changes. '''
+		if self.original_lines is not None:
+			self.lines = self.original_lines
+			self.original_lines = None
+
+	def keep_changes(self):
+		self.original_lines = None
+
+	def load(self, infile):
+		''' Replace the text by the lines of the opened file infile. Returns the buffer. '''
+		self.keep_original()
+		self.lines = [line.rstrip("\r\n") for line in infile] or [""]
+		self.keep_changes()
+		return self
+
+	def save(self, outfile):
+		''' Write the text to the opened file outfile, one line at a time. '''
+		for position, line in enumerate(self.lines):
+			if position:
+				outfile.write("\n")
+			outfile.write(line)
+
+
+class UrwishJournal(object):
+	'''Append-only journal of the values of the fields of a form, so a form
+	   can be restored after the terminal or connection was lost. Every record
+	   is a JSON line {"key": ..., "type": ..., "value": ...}, the last record
+	   of a key holds its current value. Records are flushed when written,
+	   but fsync is done at most once per sync_interval seconds. When the
+	   journal holds more than compact_records records, and at least twice as
+	   many as it has keys, or is larger than compact_bytes, and at least twice
+	   as large as the last records of the keys (e.g. a large textarea or
+	   table, which is journaled as a whole), it is rewritten with only the
+	   last record of each key.'''
+
+	def __init__(self, filename, sync_interval=1.0, compact_records=1000, compact_bytes=1 << 20):
+		self.filename = filename
+		self.sync_interval = sync_interval
+		self.compact_records = compact_records
+		self.compact_bytes = compact_bytes
+		# key -> (widget_type, value): the last record of every key.
+		self.latest = OrderedDict()
+		self.records = 0
+		# The size of the journal, and of the last record of every key (key -> size) and all of them.
+		self.size = 0
+		self.latest_sizes = {}
+		self.latest_size = 0
+		self.outfile = None
+		self.unsynced = False
+		self.last_sync = time.monotonic()
+
+	def open(self):
+		''' Read the existing journal (if any) into latest, then open it for appending. Returns the journal. '''
+		if self.outfile is None:
+			complete = self.read()
+			self.outfile = open(self.filename, 'a')
+			if not complete:
+				# Start the next record on a line of its own.
+				self.outfile.write("\n")
+		return self
+
+	def read(self):
+		''' Read the records of the journal file into latest. Returns False if its last line was cut off (by a crash). '''
+		line = "\n"
+		try:
+			infile = open(self.filename, 'r')
+		except FileNotFoundError:
+			return True
+		with infile:
+			for line in infile:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					continue
+				self.latest[record["key"]] = (record["type"], record["value"])
+				self.records += 1
+				self.count_record(record["key"], len(line))
+		return line.endswith("\n")
+
+	def count_record(self, key, size):
+		self.size += size
+		self.latest_size += size - self.latest_sizes.get(key, 0)
+		self.latest_sizes[key] = size
+
+	def record(self, key, widget_type, value):
+		''' Append a record with the new value of key. It is written to the file by the next flush or sync. '''
+		self.open()
+		line = json.dumps({"key": key, "type": widget_type, "value": value}) + "\n"
+		self.outfile.write(line)
+		self.latest[key] = (widget_type, value)
+		self.records += 1
+		self.count_record(key, len(line))
+		self.unsynced = True
+
+	def sync(self, force=False):
+		''' Flush the records written, and fsync them when sync_interval has passed since the last fsync (or with force). '''
+		if self.outfile is None:
+			return
+		self.outfile.flush()
+		if self.unsynced and (force or time.monotonic() - self.last_sync >= self.sync_interval):
+			os.fsync(self.outfile.fileno())
+			self.unsynced = False
+			self.last_sync = time.monotonic()
+		if self.records > self.compact_records and self.records >= 2 * len(self.latest):
+			self.compact()
+		elif self.size > self.compact_bytes and self.size >= 2 * self.latest_size:
+			self.compact()
+
+	def compact(self):
+		''' Rewrite the journal with only the last record of each key, replacing the file by a rename. '''
+		tmp_filename = self.filename + ".tmp"
+		with open(tmp_filename, 'w') as outfile:
+			for key, (widget_type, value) in self.latest.items():
+				outfile.write(json.dumps({"key": key, "type": widget_type, "value": value}))
+				outfile.write("\n")
+			outfile.flush()
+			os.fsync(outfile.fileno())
+		if self.outfile is not None:
+			self.outfile.close()
+		os.replace(tmp_filename, self.filename)
+		self.outfile = open(self.filename, 'a')
+		self.records = len(self.latest)
+		self.size = self.latest_size
+		self.unsynced = False
+
+	def close(self, remove=False):
+		''' Sync and close the journal; with remove, delete it (e.g. when the form has been processed). '''
+		if self.outfile is not None:
+			self.sync(force=True)
+			self.outfile.close()
+			self.outfile = None
+		if remove:
+			try:
+				os.remove(self.filename)
+			except FileNotFoundError:
+				pass
+			self.latest = OrderedDict()
+			self.records = 0
+			self.size = self.latest_size = 0
+			self.latest_sizes = {}
 
-__all__ = ['UrwishWidgetsBase', 'Urwish']
 
 class UrwishWidgetsBase(object):
 	
@@ -20,12 +686,15 @@ class UrwishWidgetsBase(object):
 		   an AttrMap wrapper.'''
 		return urwid.AttrMap(item, None, focus_map='reversed')
 
-	def urwid_listbox_window(self, title_string=""):
+	def urwid_listwalker(self, body):
+		return urwid.SimpleFocusListWalker(body)
+
+	def urwid_listbox_window(self, title_string="", background_char=u'\N{MEDIUM SHADE}'):
 		body = [urwid.Text(title_string, align='center'), urwid.Divider()]
-		listwalker = urwid.SimpleFocusListWalker(body)
+		listwalker = self.urwid_listwalker(body)
 		listbox = urwid.ListBox(listwalker)
 		pad = urwid.LineBox(urwid.Padding(listbox, left=1, right=1))
-		top = urwid.Overlay(pad, urwid.SolidFill(u'\N{MEDIUM SHADE}'),
+		top = urwid.Overlay(pad, urwid.SolidFill(background_char),
 		    align='center', width=('relative', 80),
 		    valign='middle', height=('relative', 85),
 		    min_width=20, min_height=24)
@@ -69,8 +738,8 @@ class UrwishWidgetsBase(object):
 			buttons.append(urwid.Button(caption))
 		return self.urwid_multicol_field(buttons)
 
-	def urwid_twocol_edit(self, leftcol_text, defval="", equal_space=True, width_first_col=None, leftcol_suffix=": "):
-		widget = urwid.Edit("", defval, edit_pos=0)
+	def urwid_twocol_edit(self, leftcol_text, defval="", equal_space=True, width_first_col=None, leftcol_suffix=": ", multiline=False):
+		widget = urwid.Edit("", defval, multiline=multiline, edit_pos=0)
 		return self.urwid_twocol_field(widget, leftcol_text, 
 			equal_space=equal_space, width_first_col=width_first_col, 
 			leftcol_suffix = leftcol_suffix)
@@ -92,18 +761,76 @@ class UrwishWidgetsBase(object):
 
 class Urwish(UrwishWidgetsBase):
 
-	def __init__(self, title=""):
-		self.window, self.listwalker = self.urwid_listbox_window(title)
+	def __init__(self, title="", lazy=False, lazy_cache_size=256):
+		# Build the row widgets on demand (see UrwishLazyWalker), for forms with many fields.
+		self.lazy = lazy
+		self.lazy_cache_size = lazy_cache_size
+		# Set by create_fields. Afterwards, changes to the form are patched into the listwalker.
+		self.fields_created = False
+		# widget_type -> method reading the value of a field, see get_value_extractors.
+		self.value_extractors = None
+		# widget_type -> method creating the row of a field, see get_createwidget_methods.
+		self.createwidget_methods = None
+		# Set by final_list. The keys of the fields changed since then (or since the last reset).
+		self.built = False
+		self.changed_fields = set()
+		# While running with run_async: resolved (with the form) when the form is submitted.
+		self.future = None
+		# An UrwishStats object when timings are collected, see enable_stats.
+		self.stats = None
+		self.stats_dump_interval = None
+		self.stats_dump_file = None
+		# Cached display width of the left column per field, and the number of fields per width.
+		self.descr_widths = {}
+		self.descr_width_count = Counter()
+		# Fields whose width is measured when it is needed first (urwid is imported for measuring).
+		self.unmeasured_fields = []
+		self.ok_row = None
+		# The keys received since "begin paste" while a paste is coming in, None otherwise (see input_filter).
+		self.paste_buffer = None
+		# Conditional fields (see add_rule): key -> (depends_on, visible, options), the keys of the rules
+		# depending on each field, and the keys of the fields hidden by their rule.
+		self.rules = {}
+		self.dependents = {}
+		self.hidden_fields = set()
+		# An UrwishJournal when the changes of the fields are journaled (see enable_journal), and the keys
+		# of the fields changed since they were last written to it.
+		self.journal = None
+		self.journal_pending = set()
+		# The fields set from the journal, reset restores their default (the value they were added with).
+		self.replayed_fields = set()
+		# Field changes queued by other threads (see queue_update): key -> (descr, value), applied by the
+		# MainLoop when woken through update_pipe, the write end of a pipe watched by update_loop.
+		self.pending_updates = {}
+		self.pending_updates_lock = threading.Lock()
+		self.update_pipe = None
+		self.update_loop = None
+		# The window and listwalker are created on first use (see __getattr__), as they need urwid.
+		self.title = title
 		
 		# CREATE MAIN COLLECTIONS:
-		#   The descriptive data (a list: descr, value, widgettype, urwidget) is stored here
-		self.widget_specs = {}
-		#   The order of the list by keys
-		self.widget_list = []
+		#   The descriptive data (UrwishField records: descr, value, type, urwidget, res) is stored here
+		self.widget_specs = UrwishFieldRegistry()
+		#   The order of the list by keys (a view on the registry above)
+		self.widget_list = self.widget_specs.key_list
 		
 		# PERFORM SOME INITIALISATION
 		self.define_attributes()
 
+	def __getattr__(self, name):
+		if name in ("window", "listwalker"):
+			self.create_window()
+			return self.__dict__[name]
+		raise AttributeError(name)
+
+	def create_window(self):
+		self.window, self.listwalker = self.urwid_listbox_window(self.title, self.background_char)
+
+	def urwid_listwalker(self, body):
+		if self.lazy:
+			return urwish_widgets().UrwishLazyWalker(self, body, cache_size=self.lazy_cache_size)
+		return UrwishWidgetsBase.urwid_listwalker(self, body)
+
 	def __repr__(self):
 		return self.__str__("An Urwish form with values:\n")
 
@@ -111,9 +838,10 @@ class Urwish(UrwishWidgetsBase):
 		#retstr = "Urwish values:\n"
 		def xstr(s):
 			return '' if s is None else str(s)
-		for a_widget in self.widget_list:
-			retstr += ("  [" + str(a_widget) + "] == " + xstr(self.get_value(a_widget))+"\n")
-		return retstr
+		lines = [retstr]
+		for a_widget, value in self.values().items():
+			lines.append("  [" + str(a_widget) + "] == " + xstr(value) + "\n")
+		return "".join(lines)
 
 	def define_attributes(self):
 		# End every value on the left column with this string.
@@ -127,8 +855,43 @@ class Urwish(UrwishWidgetsBase):
 		self.submit_button_leftcol_text = "Submit"
 		self.submit_button_caption = u"OK"
 
+		# The colours of the form: the focus_map of the fields is 'reversed'.
+		self.palette = [('reversed', 'standout', 'dark cyan')]
+
+		# The character filling the screen around the form.
+		self.background_char = u'\N{MEDIUM SHADE}'
+
+		# Low bandwidth mode (see enable_low_bandwidth): monochrome screen, at most
+		# max_redraws_per_second screen updates, and the bytes written counted by byte_counter.
+		self.low_bandwidth = False
+		self.max_redraws_per_second = None
+		self.byte_counter = None
+
+		# Bracketed paste: text pasted into an edit field is inserted at once, instead of key by key.
+		# paste_limit: the maximum number of characters of a paste (None: no limit), longer pastes are
+		# cut off, or ignored altogether with paste_reject. set_paste_limit sets these per field.
+		self.bracketed_paste = True
+		self.paste_limit = None
+		self.paste_reject = False
+		self.paste_limits = {}
+		# The keys of the edit fields accepting line breaks (see set_multiline). Line breaks pasted into
+		# other edit fields are removed, or with paste_reject, the paste is ignored.
+		self.multiline_edits = set()
+
 		# A (static) list of types that help define the length of the first column.		
-		self.twocol_types = ["edit", "twocolcheckbox", "radiolist", "checklist"]		
+		self.twocol_types = ["edit", "twocolcheckbox", "radiolist", "checklist", "bigradiolist", "bigchecklist", "table",
+			"textarea"]
+
+		# The number of rows of the (scrollable) list of options of bigradiolist and bigchecklist fields.
+		self.option_list_height = 8		
+
+		# The number of rows shown by the editor of table fields.
+		self.table_height = 12
+
+		# The number of rows shown by textarea fields, and whether get_value returns their text (False)
+		# or an iterator over their lines (True).
+		self.textarea_height = 8
+		self.textarea_lines = False
 
 		# This attribute collects the widget_key of the button pressed to
 		# submit the form (buttonrow clicks excluded). If the default
@@ -138,46 +901,514 @@ class Urwish(UrwishWidgetsBase):
 	def get(self, *args, **kwargs):
 		return self.get_value(*args, **kwargs)
 
+	def enable_stats(self, capacity=1024, dump_interval=None, dump_file=None):
+		''' Collect the timings of keypresses, renders, screen draws, widget creation (per widget type)
+		    and click handlers in an UrwishStats object (self.stats), keeping the last capacity timings
+		    of each. When dump_interval is given, the summaries are written to dump_file (default:
+		    stderr) every dump_interval seconds while the form is shown. Enable before building the form. '''
+		self.stats = UrwishStats(capacity)
+		self.stats_dump_interval = dump_interval
+		self.stats_dump_file = dump_file
+		return self.stats
+
+	def enable_low_bandwidth(self, max_redraws_per_second=10, count_bytes=True, output=None):
+		''' Settings for slow (e.g. SSH) connections: a plain background instead of the shaded one, a
+		    monochrome screen with only the 'standout' attribute for the field in focus, and at most
+		    max_redraws_per_second screen updates; updates requested in between are coalesced into one.
+		    With count_bytes, the bytes written to output (default: stdout) are counted, see
+		    UrwishByteCounter. Returns the byte counter. Enable before building the form. '''
+		self.low_bandwidth = True
+		self.background_char = u' '
+		self.palette = [('reversed', 'standout', 'default', 'standout')]
+		self.max_redraws_per_second = max_redraws_per_second
+		if count_bytes:
+			self.byte_counter = UrwishByteCounter(output or sys.stdout)
+		return self.byte_counter
+
+	def create_screen(self):
+		''' The screen of the MainLoop: None (urwid's default screen), unless in low bandwidth mode. '''
+		if not self.low_bandwidth:
+			return None
+		try:
+			from urwid.display.raw import Screen
+		except ImportError:
+			from urwid.raw_display import Screen
+		screen = Screen(output=self.byte_counter or sys.stdout)
+		screen.set_terminal_properties(colors=1)
+		return screen
+
+	def enable_journal(self, filename, sync_interval=1.0, compact_records=1000, compact_bytes=1 << 20, replay=True):
+		''' Journal the values of the changed fields in filename (see UrwishJournal). While the form is shown,
+		    the values of the fields changed are written every sync_interval seconds, however often they
+		    changed in between, and when the form is submitted. With replay, the values in an existing
+		    journal (left by an interrupted session) are restored first, see replay_journal. Enable after
+		    adding the fields. Returns the journal. '''
+		self.journal = UrwishJournal(filename, sync_interval, compact_records, compact_bytes).open()
+		if replay:
+			self.replay_journal()
+		return self.journal
+
+	def close_journal(self, remove=False):
+		''' Write the pending changes and close the journal; with remove, delete it. '''
+		if self.journal is None:
+			return
+		self.write_journal()
+		self.journal.close(remove)
+		self.journal = None
+
+	def replay_journal(self):
+		''' Set the values of the fields to their last values in the journal. Records of fields that
+		    are no longer in the form, or are of another type now, are ignored. '''
+		for key, (widget_type, value) in self.journal.latest.items():
+			if key in self.widget_specs and self.get_widget_type(key) == widget_type:
+				# Keep the default like mark_changed, so reset restores the value the field was added with.
+				if key not in self.changed_fields:
+					field = self.widget_specs[key]
+					field.default = field.value
+					self.changed_fields.add(key)
+				self.replayed_fields.add(key)
+				if self.fields_created:
+					self.update_field(key, value=value)
+				else:
+					self.set_widget_value(key, value)
+
+	def journal_value(self, key):
+		''' The value of a field as stored in the journal: its state as a JSON value (see get_widget_state). '''
+		widget_type = self.get_widget_type(key)
+		if widget_type == "table":
+			table = self.get_table(key)
+			return {"columns": [list(column) for column in table.columns], "rows": [list(row) for row in table.rows]}
+		if widget_type == "textarea":
+			return self.get_text_buffer(key).text()
+		return self.get_widget_state(key)
+
+	def write_journal(self, force_sync=True):
+		''' Append the values of the fields changed since the last write to the journal, and sync it. '''
+		journal_pending, self.journal_pending = self.journal_pending, set()
+		for key in journal_pending:
+			if key in self.widget_specs and self.get_widget_type(key) not in ("button", "buttonrow"):
+				self.journal.record(key, self.get_widget_type(key), self.journal_value(key))
+		self.journal.sync(force_sync)
+
+	def journal_alarm(self, loop, user_data=None):
+		if self.journal is None:
+			return
+		if self.journal_pending:
+			self.write_journal(force_sync=False)
+		loop.set_alarm_in(self.journal.sync_interval, self.journal_alarm)
+
+	def set_paste_limit(self, key, limit, reject=False):
+		''' Cut off pastes into field key after limit characters, or with reject, ignore pastes longer
+		    than that. limit None: no limit for this field. '''
+		self.paste_limits[key] = (limit, reject)
+
+	def set_multiline(self, key, multiline=True):
+		''' Let the edit field key accept line breaks: enter starts a new line, and pasted text keeps its line breaks. '''
+		if multiline:
+			self.multiline_edits.add(key)
+		else:
+			self.multiline_edits.discard(key)
+		if self.get_widget(key) is not None:
+			self.get_widget(key).multiline = multiline
+
+	def focus_key(self):
+		''' Return the key of the field in focus, None for the rows below the fields (e.g. the OK button). '''
+		position = self.listwalker.focus
+		if position is None or position >= len(self.widget_list):
+			return None
+		return self.widget_list[position]
+
+	def input_filter(self, keys, raw):
+		''' MainLoop input filter: the keys between "begin paste" and "end paste" (which may arrive in
+		    several batches) are collected and handed to paste as a whole. '''
+		if self.paste_buffer is None and "begin paste" not in keys:
+			return keys
+		passed_keys = []
+		for key in keys:
+			if key == "begin paste":
+				self.paste_buffer = []
+			elif self.paste_buffer is None:
+				passed_keys.append(key)
+			elif key == "end paste":
+				passed_keys.extend(self.paste(self.paste_buffer))
+				self.paste_buffer = None
+			else:
+				self.paste_buffer.append(key)
+		return passed_keys
+
+	def paste(self, keys):
+		''' Insert the pasted keys into the edit field in focus as one piece of text, so it changes (and
+		    is drawn) once. Returns the keys to pass on to the widgets: the pasted keys themselves when
+		    no edit field has the focus. '''
+		widget_key = self.focus_key()
+		if widget_key is None or self.get_widget_type(widget_key) not in ("edit", "textarea") or self.get_widget(widget_key) is None:
+			return keys
+		text = self.paste_text(keys)
+		limit, reject = self.paste_limits.get(widget_key, (self.paste_limit, self.paste_reject))
+		if "\n" in text and self.get_widget_type(widget_key) == "edit" and widget_key not in self.multiline_edits:
+			# A single line field.
+			if reject:
+				return []
+			text = text.replace("\n", "")
+		if limit is not None and len(text) > limit:
+			if reject:
+				return []
+			text = text[:limit]
+		# Emits the 'change' signal of the Edit or UrwishTextArea, see field_change.
+		self.get_widget(widget_key).insert_text(text)
+		return []
+
+	def paste_text(self, keys):
+		''' The text of pasted keys: characters as they are, "enter" and "tab" as newline and tab. Other
+		    keys (and mouse events) are dropped. '''
+		names = {"enter": "\n", "tab": "\t"}
+		return "".join(key if len(key) == 1 else names.get(key, "") for key in keys if isinstance(key, str))
+
+	def bracketed_paste_loop(self, loop):
+		''' Switch the terminal to bracketed paste mode while loop runs. '''
+		start, stop = loop.start, loop.stop
+		def paste_start(*args, **kwargs):
+			result = start(*args, **kwargs)
+			set_bracketed_paste_mode(loop.screen, True)
+			return result
+		def paste_stop(*args, **kwargs):
+			set_bracketed_paste_mode(loop.screen, False)
+			return stop(*args, **kwargs)
+		loop.start, loop.stop = paste_start, paste_stop
+		return loop
+
+	def loop_widget(self):
+		''' The widget shown by the MainLoop: the window, wrapped for timing when stats are enabled. '''
+		if self.stats is None:
+			return self.window
+		return urwish_widgets().UrwishTimingWrap(self.window, self.stats)
+
+	def instrument_loop(self, loop):
+		''' Time the screen updates of loop and schedule the periodic stats dump (when stats are enabled),
+		    count the bytes of the screen updates and limit their rate (in low bandwidth mode). '''
+		if self.stats is not None:
+			stats = self.stats
+			draw_screen = loop.draw_screen
+			def timed_draw_screen():
+				start = time.perf_counter()
+				draw_screen()
+				stats.record("draw", time.perf_counter() - start)
+			loop.draw_screen = timed_draw_screen
+			if self.stats_dump_interval:
+				loop.set_alarm_in(self.stats_dump_interval, self.dump_stats_alarm)
+		if self.byte_counter is not None:
+			self.count_draw_bytes(loop)
+		if self.max_redraws_per_second:
+			self.limit_redraws(loop)
+		return loop
+
+	def count_draw_bytes(self, loop):
+		byte_counter = self.byte_counter
+		draw_screen = loop.draw_screen
+		def counted_draw_screen():
+			byte_counter.start_draw()
+			try:
+				draw_screen()
+			finally:
+				byte_counter.end_draw()
+		loop.draw_screen = counted_draw_screen
+
+	def limit_redraws(self, loop):
+		''' Draw the screen of loop at most max_redraws_per_second times per second. A redraw asked for
+		    sooner is postponed by an alarm; the redraws asked for until then are done at once. '''
+		interval = 1.0 / self.max_redraws_per_second
+		draw_screen = loop.draw_screen
+		last_draw = 0.0
+		pending_alarm = None
+		def redraw_due(loop, user_data=None):
+			# The MainLoop redraws the screen when it becomes idle after this alarm.
+			nonlocal pending_alarm
+			pending_alarm = None
+		def limited_draw_screen():
+			nonlocal last_draw, pending_alarm
+			wait = last_draw + interval - time.monotonic()
+			if wait > 0:
+				if pending_alarm is None:
+					pending_alarm = loop.set_alarm_in(wait, redraw_due)
+				return
+			last_draw = time.monotonic()
+			draw_screen()
+		loop.draw_screen = limited_draw_screen
+
+	def dump_stats_alarm(self, loop, user_data=None):
+		self.stats.dump(self.stats_dump_file)
+		loop.set_alarm_in(self.stats_dump_interval, self.dump_stats_alarm)
+
+	def click_handler(self, handler):
+		''' Return handler for connecting to a 'click' signal; with stats enabled, wrapped to record its duration. '''
+		if self.stats is None:
+			return handler
+		stats = self.stats
+		name = "callback:" + handler.__name__
+		def timed_handler(*args):
+			start = time.perf_counter()
+			try:
+				return handler(*args)
+			finally:
+				stats.record(name, time.perf_counter() - start)
+		return timed_handler
+
 	def add(self, *args, **kwargs):
 		return self.add_input(*args, **kwargs)
 
 	def add_input(self, widget_type, assign_key=None, descr="", value=""):
+		''' Add a field to the form. Returns the key of the field. Use insert_field to add a field to a form that has been built already. '''
 		if assign_key == None:
-			assign_key = time.time()
-			# But using fast systems, two equal timestamps might be created
-			# Make sure this is prevented.
-			while (assign_key in self.widget_list):
-				assign_key = time.time()
-		if assign_key in self.widget_list:
+			assign_key = self.widget_specs.new_key()
+		if assign_key in self.widget_specs:
 			print("WARNING: Key {",assign_key,"} already present in widget_list. Now overwriting, might cause errors.")
-		self.widget_specs[assign_key] = {"descr":descr, "value":value, "type":widget_type}
-		# The list has all the widgets in the urwid menu in the right order (whereas dictionaries are unordered)
-		self.widget_list.append(assign_key)
+		self.forget_descr_width(assign_key)
+		# The registry keeps the fields in the order of the urwid menu
+		self.widget_specs[assign_key] = UrwishField(descr, value, widget_type)
+		self.measure_descr_width(assign_key)
+		return assign_key
+
+	def insert_field(self, widget_type, assign_key=None, descr="", value="", position=None):
+		''' Add a field at position (an index in widget_list, default: at the end). On a form that
+		    has been built already, only the row of the new field is created. Returns the key of the field. '''
+		if assign_key is not None and assign_key in self.widget_specs:
+			raise ValueError("Key already present in Urwish form", assign_key)
+		if assign_key is None:
+			assign_key = self.widget_specs.new_key()
+		if position is None or position > len(self.widget_list):
+			position = len(self.widget_list)
+		self.widget_specs.insert(position, assign_key, UrwishField(descr, value, widget_type))
+		self.measure_descr_width(assign_key)
+		if self.fields_created:
+			if self.lazy:
+				self.listwalker.field_inserted(position)
+			else:
+				self.listwalker.insert(position, self.create_widget(assign_key))
+			# A new row built with a narrower left column is updated here too.
+			self.update_descr_col_width()
+		return assign_key
+
+	def remove_field(self, key):
+		''' Remove a field from the form. On a form that has been built already, only its row is removed. '''
+		self.forget_descr_width(key)
+		position = self.widget_specs.remove(key)
+		if self.fields_created:
+			if self.lazy:
+				self.listwalker.field_removed(position, key)
+			else:
+				del self.listwalker[position]
+			self.update_descr_col_width()
+
+	def update_field(self, key, descr=None, value=None):
+		''' Change the description and/or the (default) value of a field. On a form that has been
+		    built already, only the row of this field is recreated; without a new value, it keeps the
+		    value entered by the user. '''
+		if self.fields_created:
+			self.release_widget(key)
+		if descr is not None:
+			self.widget_specs[key].descr = descr
+		if value is not None:
+			self.set_widget_value(key, value)
+			if key in self.changed_fields:
+				# The new value is the one reset restores.
+				self.widget_specs[key].default = value
+		self.forget_descr_width(key)
+		self.measure_descr_width(key)
+		if self.fields_created:
+			self.update_descr_col_width()
+			self.refresh_row(key)
+		if value is not None and key in self.dependents:
+			self.apply_rules(key)
+
+	def refresh_row(self, key):
+		''' Recreate the row of a field from widget_specs, on a form that has been built already. Store
+		    the state of its widget first (see release_widget) to keep it. '''
+		if self.lazy:
+			if "urwidget" in self.widget_specs[key]:
+				del self.widget_specs[key]["urwidget"]
+			self.listwalker.field_changed(key)
+		else:
+			self.listwalker[self.widget_specs.position(key)] = self.create_widget(key)
+
+	def add_rule(self, key, depends_on, visible=None, options=None):
+		''' Make field key depend on the fields in depends_on (a key or a list of keys). visible(values) returns
+		    whether the field is shown, options(values) returns its options (the "value" of radiolist, checklist
+		    and big* fields), where values is a dictionary of the values (see get_value) of the fields in
+		    depends_on. The rules are evaluated when the form is built; afterwards, a change of a field only
+		    evaluates the rules depending on it, and only the rows of the fields whose visibility or options
+		    changed are recreated. Hidden fields keep their value. '''
+		if isinstance(depends_on, str):
+			depends_on = [depends_on]
+		self.rules[key] = (list(depends_on), visible, options)
+		for dependency in depends_on:
+			if dependency not in self.dependents:
+				self.dependents[dependency] = []
+				if dependency in self.widget_specs and self.get_widget(dependency) is not None:
+					self.connect_rule_triggers(dependency)
+			self.dependents[dependency].append(key)
+		if self.fields_created and self.evaluate_rule(key):
+			self.apply_rules(key)
+
+	def connect_rule_triggers(self, key):
+		''' Evaluate the rules depending on field key whenever its widget changed. '''
+		widget_type = self.get_widget_type(key)
+		widget = self.get_widget(key)
+		# Unlike 'change', 'postchange' is emitted after the value of an urwid widget changed.
+		signal = 'change' if widget_type in ("bigradiolist", "bigchecklist", "table", "textarea") else 'postchange'
+		for a_widget in (widget if widget_type in ("radiolist", "checklist") else [widget]):
+			urwid.connect_signal(a_widget, signal, self.rule_trigger, key)
+
+	def rule_trigger(self, widget, old_value, key):
+		self.apply_rules(key)
+
+	def apply_rules(self, changed_key):
+		''' Evaluate the rules depending on changed_key, and in turn those depending on the fields
+		    whose options were changed by them. Every rule is evaluated once. '''
+		changed_keys = [changed_key]
+		evaluated = set()
+		while changed_keys:
+			for key in self.dependents.get(changed_keys.pop(), ()):
+				if key not in evaluated:
+					evaluated.add(key)
+					if self.evaluate_rule(key):
+						changed_keys.append(key)
+
+	def evaluate_rules(self):
+		''' Evaluate all rules, e.g. when the form is built. '''
+		for key in list(self.rules):
+			if self.evaluate_rule(key):
+				self.apply_rules(key)
+
+	def evaluate_rule(self, key):
+		''' Show or hide field key and set its options according to its rule, recreating its row when the
+		    form has been built and either changed. Returns True if its options changed. '''
+		if key not in self.widget_specs:
+			return False
+		depends_on, visible, options = self.rules[key]
+		values = dict((dependency, self.rule_value(dependency)) for dependency in depends_on if dependency in self.widget_specs)
+		changed = options_changed = False
+		if visible is not None:
+			hidden = not visible(values)
+			if hidden != (key in self.hidden_fields):
+				changed = True
+				if hidden:
+					# Keep the value of the field, its widget will not be shown.
+					self.release_widget(key)
+					self.hidden_fields.add(key)
+				else:
+					self.hidden_fields.discard(key)
+		if options is not None:
+			new_options = list(options(values))
+			if [str(label) for label in new_options] != self.get_option_labels(key):
+				changed = options_changed = True
+				self.set_widget_value(key, self.keep_option_states(key, new_options))
+		if changed and self.fields_created:
+			self.refresh_row(key)
+		return options_changed
+
+	def rule_value(self, key):
+		if self.get_widget(key) is None:
+			return self.get_spec_value(key)
+		return self.get_value(key)
+
+	def keep_option_states(self, key, new_options):
+		''' The value of a radiolist, checklist or big* field with new_options, keeping the states of the options it had before. '''
+		state = self.get_widget_value(key) if self.get_widget(key) is None else self.get_widget_state(key)
+		if not hasattr(state, 'items'):
+			return new_options
+		new_value = OrderedDict((label, state.get(label, False)) for label in new_options)
+		# A radiolist without a selected option selects its first option.
+		return new_value if any(new_value.values()) else new_options
+
+	def queue_update(self, key, descr=None, value=None):
+		''' Like update_field (value: the options of radiolist, checklist and big* fields), but safe to call
+		    from any thread while the form is shown. The change is applied by the MainLoop; all changes
+		    queued until then are applied at once, and only the latest description and value of a field
+		    count. Only the first change after the MainLoop caught up wakes it, so this never waits for it. '''
+		with self.pending_updates_lock:
+			wake = not self.pending_updates
+			pending = self.pending_updates.get(key)
+			if pending is not None:
+				descr = pending[0] if descr is None else descr
+				value = pending[1] if value is None else value
+			self.pending_updates[key] = (descr, value)
+			# Written holding the lock, so unwatch_updates can't close the pipe in between.
+			if wake and self.update_pipe is not None:
+				os.write(self.update_pipe, b"u")
+
+	def watch_updates(self, loop):
+		''' Apply the changes queued by queue_update in loop (the MainLoop showing this form). '''
+		self.unwatch_updates()
+		with self.pending_updates_lock:
+			self.update_loop = loop
+			self.update_pipe = loop.watch_pipe(self.apply_updates)
+			if self.pending_updates:
+				os.write(self.update_pipe, b"u")
+
+	def unwatch_updates(self):
+		''' Stop watching for queued changes when the MainLoop showing this form has ended. Changes queued
+		    afterwards are applied when the form is shown again. '''
+		with self.pending_updates_lock:
+			loop, update_pipe = self.update_loop, self.update_pipe
+			self.update_loop = self.update_pipe = None
+			if update_pipe is not None:
+				loop.remove_watch_pipe(update_pipe)
+				os.close(update_pipe)
+
+	def apply_updates(self, data=None):
+		''' Apply the changes queued by queue_update (called by the MainLoop, which redraws the screen once afterwards). '''
+		with self.pending_updates_lock:
+			pending_updates, self.pending_updates = self.pending_updates, {}
+		for key, (descr, value) in pending_updates.items():
+			if key in self.widget_specs:
+				self.update_field(key, descr, value)
+		# Keep watching the pipe.
+		return True
 
 	def set_widget(self, widkey, widget):
-		self.widget_specs[widkey]["urwidget"] = widget
+		self.widget_specs[widkey].urwidget = widget
 	def get_widget(self, widkey):
-		if "urwidget" in self.widget_specs[widkey]:
-			return self.widget_specs[widkey]["urwidget"]
-		return None
+		return getattr(self.widget_specs[widkey], "urwidget", None)
+
+	def release_widget(self, widkey):
+		''' Store the current value of the widget in widget_specs and forget the widget. The lazy walker calls this when a row is dropped; create_widget will rebuild it from the stored value. '''
+		if self.get_widget(widkey) is None:
+			return
+		self.set_widget_value(widkey, self.get_widget_state(widkey))
+		del self.widget_specs[widkey].urwidget
+
+	def get_widget_state(self, key):
+		''' Return the state of the widget in the format of the "value" in widget_specs, so the widget can be recreated with the same state. '''
+		if self.get_widget(key) is None:
+			# Not built, or released by the lazy walker, which stored its state in "value".
+			return self.get_widget_value(key)
+		widget_type = self.get_widget_type(key)
+		if (widget_type == "edit"):
+			return self.get_edit_value(key)
+		if (widget_type == "checkbox" or widget_type=="twocolcheckbox"):
+			return self.get_checkbox_value(key)
+		if (widget_type == "radiolist" or widget_type == "checklist"):
+			return OrderedDict([(a_button.label, a_button.get_state()) for a_button in self.get_widget(key)])
+		if (widget_type == "bigradiolist" or widget_type == "bigchecklist"):
+			return OrderedDict(zip(self.get_widget(key).labels, self.get_widget(key).get_states()))
+		# Tables (the cells are written to the UrwishTable in "value" while editing) and other types.
+		return self.get_widget_value(key)
 
 	def get_widget_type(self, key):
-		return self.widget_specs[key]["type"]
+		return self.widget_specs[key].type
 
 	def get_widget_descr(self, key):
-		return self.widget_specs[key]["descr"]
+		return self.widget_specs[key].descr
 
 	def get_widget_value(self, key):
-		return self.widget_specs[key]["value"]
+		return self.widget_specs[key].value
 	def set_widget_value(self, key, value):
-		self.widget_specs[key]["value"] = value
+		self.widget_specs[key].value = value
 
 	def get_widget_result(self, key):
-		if "res" in self.widget_specs[key]:
-			return self.widget_specs[key]["res"]
-		return None
+		return getattr(self.widget_specs[key], "res", None)
 	def set_widget_result(self, key, value):
-		self.widget_specs[key]["res"] = value
+		self.widget_specs[key].res = value
 
 
 	def create_fields(self):
@@ -185,34 +1416,67 @@ class Urwish(UrwishWidgetsBase):
 		self.descr_colwidth = self.get_descr_col_width()
 		# Remove items from list (if any), necessary if create_fields is called twice.
 		del self.listwalker[:]
+		self.ok_row = None
+		# All rows are created below, the rules don't need to patch them.
+		self.fields_created = False
+		self.evaluate_rules()
+		self.fields_created = True
+		self.value_extractors = self.get_value_extractors()
+		if self.lazy:
+			# The lazy walker creates the widgets when they are shown.
+			self.listwalker.set_keys(self.widget_list)
+			return
 		for widkey in self.widget_list:
 			self.listwalker.append(self.create_widget(widkey))
 
 	def create_widget(self, widget_key):
-		create_method = self.get_createwidget_method(self.widget_specs[widget_key]["type"])
-		return create_method(widget_key)
+		if widget_key in self.hidden_fields:
+			# The row of a hidden field is empty. Without the lazy walker the widget is created all the
+			# same, so get_value reads hidden fields like the others.
+			if not self.lazy:
+				self.build_widget(widget_key)
+			return urwid.Pile([])
+		return self.build_widget(widget_key)
+
+	def build_widget(self, widget_key):
+		widget_type = self.widget_specs[widget_key].type
+		create_method = self.get_createwidget_method(widget_type)
+		if self.stats is None:
+			widget = create_method(widget_key)
+		else:
+			start = time.perf_counter()
+			widget = create_method(widget_key)
+			self.stats.record("build:" + str(widget_type), time.perf_counter() - start)
+		if widget_key in self.dependents and self.get_widget(widget_key) is not None:
+			self.connect_rule_triggers(widget_key)
+		return widget
+
+	def get_createwidget_methods(self):
+		''' The "switch/case" for creating widgets: widget_type -> method(widget_key) returning the row of
+		    the field. Built when the first widget is created, these are the valid widget types. '''
+		return {
+			"edit": self.create_input,
+			"checkbox": self.create_checkbox,
+			"twocolcheckbox": self.create_twocol_checkbox,
+			"radiolist": self.create_radiolist,
+			"checklist": self.create_checklist,
+			"bigradiolist": self.create_bigradiolist,
+			"bigchecklist": self.create_bigchecklist,
+			"table": self.create_table,
+			"textarea": self.create_textarea,
+			"button": self.create_button,
+			"buttonrow": self.create_buttonrow,
+			"spacer": self.create_spacer,
+			"text": self.create_text,
+		}
 
 	def get_createwidget_method(self, widget_type):
-		if widget_type == "edit":
-			return self.create_input
-		if widget_type == "checkbox":
-			return self.create_checkbox
-		if widget_type=="twocolcheckbox":
-			return self.create_twocol_checkbox
-		if widget_type == "radiolist":
-			return self.create_radiolist
-		if widget_type=="checklist":
-			return self.create_checklist
-		if widget_type=="button":
-			return self.create_button
-		if widget_type=="buttonrow":
-			return self.create_buttonrow
-		if widget_type=="spacer":
-			return self.create_spacer
-		if widget_type=="text":
-			return self.create_text
-		raise ValueError("Unknown Urwish widget_type", widget_type, 
-			"See Urwish::get_createwidget_method for valid options.")
+		if self.createwidget_methods is None:
+			self.createwidget_methods = self.get_createwidget_methods()
+		if widget_type not in self.createwidget_methods:
+			raise ValueError("Unknown Urwish widget_type", widget_type,
+				"See Urwish::get_createwidget_methods for valid options.")
+		return self.createwidget_methods[widget_type]
 
 	def create_spacer(self, widget_key):
 		return urwid.Divider()
@@ -223,8 +1487,10 @@ class Urwish(UrwishWidgetsBase):
 	def create_input(self, widget_key):
 		list_columns_item, edit_widget = \
 			self.urwid_twocol_edit(self.widget_specs[widget_key]["descr"], self.widget_specs[widget_key]["value"], 
-				equal_space=True, width_first_col=self.descr_colwidth, leftcol_suffix = self.leftcol_default_suffix)
+				equal_space=True, width_first_col=self.descr_colwidth, leftcol_suffix = self.leftcol_default_suffix,
+				multiline=widget_key in self.multiline_edits)
 		self.set_widget(widget_key, edit_widget)
+		urwid.connect_signal(edit_widget, 'change', self.field_change, widget_key)
 		return list_columns_item
 
 
@@ -261,7 +1527,7 @@ class Urwish(UrwishWidgetsBase):
 				equal_space=True, width_first_col=self.descr_colwidth, 
 				leftcol_suffix = leftcol_suffix)
 		self.set_widget_result(widget_key, False)
-		urwid.connect_signal(button_widget, 'click', self.manual_button_click, widget_key)
+		urwid.connect_signal(button_widget, 'click', self.click_handler(self.manual_button_click), widget_key)
 		return list_columns_item
 
 	def create_buttonrow(self, widget_key):
@@ -274,7 +1540,7 @@ class Urwish(UrwishWidgetsBase):
 			self.urwid_buttonrow(button_caption_list)
 		for button in button_list:
 			self.set_widget_result(widget_key, None)
-			urwid.connect_signal(button, 'click', self.buttonrow_click, widget_key)
+			urwid.connect_signal(button, 'click', self.click_handler(self.buttonrow_click), widget_key)
 		return columns
 
 
@@ -283,11 +1549,13 @@ class Urwish(UrwishWidgetsBase):
 			self.urwid_twocol_checkbox(self.widget_specs[widget_key]["descr"], self.widget_specs[widget_key]["value"], 
 				equal_space=True, width_first_col=self.descr_colwidth, leftcol_suffix = self.leftcol_default_suffix)
 		self.set_widget(widget_key, checkbox_widget)
+		urwid.connect_signal(checkbox_widget, 'change', self.field_change, widget_key)
 		return list_columns_item
 
 	def create_checkbox(self, widget_key):
 		cb = urwid.CheckBox(self.get_widget_descr(widget_key), state=bool(self.get_widget_value(widget_key)))
 		self.set_widget(widget_key, cb)
+		urwid.connect_signal(cb, 'change', self.field_change, widget_key)
 		return cb
 
 	def ensure_radiobutton_state_values(self, an_iterable, list_value = False):
@@ -307,8 +1575,15 @@ class Urwish(UrwishWidgetsBase):
 	def create_checklist(self, widget_key):
 		checkgroup = []
 		checkbox_values = self.ensure_radiobutton_state_values(self.get_widget_value(widget_key))
-		for key, value in checkbox_values.items():
-			checkgroup.append(urwid.CheckBox(key, bool(value)))
+		# The labels of the checked boxes are tracked (with their index, for the order) in "selected"
+		selected = {}
+		for index, (key, value) in enumerate(checkbox_values.items()):
+			checkbox = urwid.CheckBox(key, bool(value))
+			if checkbox.get_state():
+				selected[checkbox.label] = index
+			urwid.connect_signal(checkbox, 'change', self.checklist_change, (widget_key, index))
+			checkgroup.append(checkbox)
+		self.widget_specs[widget_key].selected = selected
 		pile = urwid.Pile(checkgroup)
 		list_columns_item, checklist_widget = self.urwid_twocol_field(pile, 
 			self.get_widget_descr(widget_key), equal_space=False, width_first_col=self.descr_colwidth,
@@ -322,6 +1597,12 @@ class Urwish(UrwishWidgetsBase):
 		radio_values = self.ensure_radiobutton_state_values(self.get_widget_value(widget_key), "first True")
 		for key, value in radio_values.items():
 			urwid.RadioButton(radiogroup, key, value)
+		# The label of the selected button is tracked in "selected"
+		self.widget_specs[widget_key].selected = None
+		for a_radiobutton in radiogroup:
+			if a_radiobutton.get_state():
+				self.widget_specs[widget_key].selected = a_radiobutton.label
+			urwid.connect_signal(a_radiobutton, 'change', self.radiolist_change, widget_key)
 		pile = urwid.Pile(radiogroup)
 		#return pile
 		list_columns_item, radio_widget = self.urwid_twocol_field(pile, 
@@ -331,52 +1612,324 @@ class Urwish(UrwishWidgetsBase):
 		return list_columns_item
 
 
+	def field_change(self, widget, new_value, widget_key):
+		self.mark_changed(widget_key)
+
+	def mark_changed(self, widget_key):
+		''' Remember that a field differs from its default value, so reset will restore it. '''
+		if self.journal is not None:
+			self.journal_pending.add(widget_key)
+		if widget_key in self.changed_fields:
+			return
+		self.changed_fields.add(widget_key)
+		# Keep the default, the lazy walker stores the edited value in "value" when releasing the row.
+		field = self.widget_specs[widget_key]
+		field.default = field.value
+
+	def get_option_selection(self, widget_key, multiple=False):
+		''' Return the labels and the selected positions of a bigradiolist or bigchecklist according to its "value"
+		    (a list of labels or a dictionary of labels and states, like radiolist and checklist). '''
+		value = self.get_widget_value(widget_key)
+		if not hasattr(value, '__iter__'):
+			raise TypeError("Option values are not iterable. Cannot create Urwish option list.")
+		labels = [str(label) for label in value]
+		states = list(value.values()) if hasattr(value, 'items') else None
+		if multiple:
+			if states is None:
+				return labels, set()
+			return labels, set(position for position, state in enumerate(states) if state)
+		if states is None:
+			# Like a radiolist, select the first option by default.
+			return labels, (0 if labels else None)
+		selected = None
+		for position, state in enumerate(states):
+			if state == "first True":
+				state = (position == 0)
+			if state:
+				selected = position
+		return labels, selected
+
+	def create_option_list(self, widget_key, multiple):
+		labels, selected = self.get_option_selection(widget_key, multiple)
+		option_list = urwish_widgets().UrwishOptionList(labels, selected, multiple=multiple, height=self.option_list_height)
+		urwid.connect_signal(option_list, 'change', self.field_change, widget_key)
+		list_columns_item, option_widget = self.urwid_twocol_field(option_list,
+			self.get_widget_descr(widget_key), equal_space=False, width_first_col=self.descr_colwidth,
+			leftcol_suffix = self.leftcol_default_suffix)
+		self.set_widget(widget_key, option_list)
+		return list_columns_item
+
+	def create_bigradiolist(self, widget_key):
+		return self.create_option_list(widget_key, False)
+
+	def create_bigchecklist(self, widget_key):
+		return self.create_option_list(widget_key, True)
+
+	def get_table(self, widget_key):
+		''' Return the UrwishTable of a table field. A "value" given as a dictionary with "columns" (and
+		    "rows") is replaced by an UrwishTable first. '''
+		value = self.get_widget_value(widget_key)
+		if not isinstance(value, UrwishTable):
+			if not hasattr(value, 'get') or "columns" not in value:
+				raise TypeError("The value of a table field is an UrwishTable or a dictionary with columns (and rows).")
+			value = UrwishTable(value["columns"], value.get("rows"))
+			self.set_widget_value(widget_key, value)
+		return value
+
+	def create_table(self, widget_key):
+		editor = urwish_widgets().UrwishTableEditor(self.get_table(widget_key), height=self.table_height)
+		urwid.connect_signal(editor, 'change', self.field_change, widget_key)
+		list_columns_item, table_widget = self.urwid_twocol_field(editor,
+			self.get_widget_descr(widget_key), equal_space=False, width_first_col=self.descr_colwidth,
+			leftcol_suffix = self.leftcol_default_suffix)
+		self.set_widget(widget_key, editor)
+		return list_columns_item
+
+	def load_table(self, widget_key, infile, format="csv"):
+		''' Append the records in the opened CSV or JSON lines file infile to the rows of a table field (see UrwishTable.load). '''
+		self.get_table(widget_key).load(infile, format)
+		editor = self.get_widget(widget_key)
+		if editor is not None:
+			editor.refresh()
+
+	def save_table(self, widget_key, outfile, format="csv"):
+		''' Write the rows of a table field to the opened file outfile (see UrwishTable.save). '''
+		self.get_table(widget_key).save(outfile, format)
+
+	def get_text_buffer(self, widget_key):
+		''' Return the UrwishTextBuffer of a textarea field. A "value" given as a string (or a list of lines)
+		    is replaced by an UrwishTextBuffer first. '''
+		value = self.get_widget_value(widget_key)
+		if not isinstance(value, UrwishTextBuffer):
+			value = UrwishTextBuffer("" if value is None else value)
+			self.set_widget_value(widget_key, value)
+		return value
+
+	def create_textarea(self, widget_key):
+		text_area = urwish_widgets().UrwishTextArea(self.get_text_buffer(widget_key), height=self.textarea_height)
+		urwid.connect_signal(text_area, 'change', self.field_change, widget_key)
+		list_columns_item, textarea_widget = self.urwid_twocol_field(text_area,
+			self.get_widget_descr(widget_key), equal_space=False, width_first_col=self.descr_colwidth,
+			leftcol_suffix = self.leftcol_default_suffix)
+		self.set_widget(widget_key, text_area)
+		return list_columns_item
+
+	def load_text(self, widget_key, infile):
+		''' Replace the text of a textarea field by the lines of the opened file infile. '''
+		self.get_text_buffer(widget_key).load(infile)
+		text_area = self.get_widget(widget_key)
+		if text_area is not None:
+			text_area.refresh()
+
+	def save_text(self, widget_key, outfile):
+		''' Write the text of a textarea field to the opened file outfile. '''
+		self.get_text_buffer(widget_key).save(outfile)
+
+	def checklist_change(self, checkbox, new_state, key_index):
+		widget_key, index = key_index
+		self.mark_changed(widget_key)
+		if new_state:
+			self.widget_specs[widget_key].selected[checkbox.label] = index
+		else:
+			self.widget_specs[widget_key].selected.pop(checkbox.label, None)
+
+	def radiolist_change(self, radiobutton, new_state, widget_key):
+		field = self.widget_specs[widget_key]
+		self.mark_changed(widget_key)
+		if new_state:
+			field.selected = radiobutton.label
+		elif field.selected == radiobutton.label:
+			field.selected = None
+
 	def get_value(self, key):
-		# A "switch/case" kind of method. Behave according to the widget_type.
+		field = self.widget_specs[key]
+		return self.get_value_extractor(field.type)(key, field)
+
+	def get_value_extractors(self):
+		''' The "switch/case" for reading values: widget_type -> method(key, field) returning the value of
+		    the field. Built when the form is created. Types not listed return the "value" of the field. '''
+		return {
+			"button": self.read_button_value,
+			"buttonrow": self.read_buttonrow_value,
+			"edit": self.read_edit_value,
+			"checkbox": self.read_checkbox_value,
+			"twocolcheckbox": self.read_checkbox_value,
+			"radiolist": self.read_radiolist_value,
+			"checklist": self.read_checklist_values,
+			"bigradiolist": self.read_option_list_value,
+			"bigchecklist": self.read_option_list_value,
+			"table": self.read_table_value,
+			"textarea": self.read_textarea_value,
+		}
+
+	def get_value_extractor(self, widget_type):
+		if self.value_extractors is None:
+			self.value_extractors = self.get_value_extractors()
+		return self.value_extractors.get(widget_type, self.read_spec_value)
+
+	def values(self, keys=None):
+		''' Return a snapshot of the values (as get_value would return them) of all fields, or of the
+		    fields in keys, as an OrderedDict. '''
+		if keys is None:
+			keys = self.widget_list
+		fields = self.widget_specs
+		extractors = self.value_extractors
+		if extractors is None:
+			extractors = self.value_extractors = self.get_value_extractors()
+		read_spec_value = self.read_spec_value
+		snapshot = OrderedDict()
+		for key in keys:
+			field = fields[key]
+			snapshot[key] = extractors.get(field.type, read_spec_value)(key, field)
+		return snapshot
+
+	def to_dict(self, *args, **kwargs):
+		return self.values(*args, **kwargs)
+
+	def write_values(self, outfile, format="jsonl", header=True, values=None):
+		''' Write a snapshot of the values to the opened file outfile, as one line of JSON ("jsonl") or as
+		    a row of CSV ("csv", preceded by a row with the keys if header is set; lists are joined by ";").
+		    Call repeatedly (with header=False for csv) to stream the values of several records. '''
+		if values is None:
+			values = self.values()
+		if format == "jsonl":
+			json.dump(OrderedDict((str(key), value) for key, value in values.items()), outfile, default=self.json_value)
+			outfile.write("\n")
+		elif format == "csv":
+			writer = csv.writer(outfile)
+			if header:
+				writer.writerow([str(key) for key in values])
+			writer.writerow([self.csv_cell(value) for value in values.values()])
+		else:
+			raise ValueError("Unknown Urwish export format", format, "Use 'jsonl' or 'csv'.")
+
+	def read_records(self, infile, format="jsonl"):
+		''' Yield the records (dictionaries) in the opened file infile: JSON lines ("jsonl", empty lines are
+		    skipped) or CSV with a header row of keys ("csv"). '''
+		if format == "jsonl":
+			for line in infile:
+				if line.strip():
+					yield json.loads(line)
+		elif format == "csv":
+			for row in csv.DictReader(infile):
+				yield row
+		else:
+			raise ValueError("Unknown Urwish import format", format, "Use 'jsonl' or 'csv'.")
+
+	def json_value(self, value):
+		# The rows of a table field and the lines of a textarea field (iterators) are written as a list.
+		if hasattr(value, '__next__'):
+			return list(value)
+		return str(value)
+
+	def csv_cell(self, value):
+		if value is None:
+			return ""
+		if isinstance(value, (list, tuple)):
+			return ";".join(str(item) for item in value)
+		if hasattr(value, '__next__'):
+			return json.dumps(list(value))
+		return value
+
+	def read_spec_value(self, key, field):
+		return field.value
+
+	def read_unbuilt_value(self, key, field):
+		# The widget has not been created (yet). In lazy mode: the row has not been shown yet, or has been released by the walker.
+		if self.lazy:
+			return self.get_spec_value(key)
+		return None
+
+	def read_button_value(self, key, field):
+		return self.button_pressed == key
+
+	def read_buttonrow_value(self, key, field):
+		return getattr(field, "res", None)
+
+	def read_edit_value(self, key, field):
+		widget = getattr(field, "urwidget", None)
+		if widget is None:
+			return self.read_unbuilt_value(key, field)
+		return widget.get_edit_text()
+
+	def read_checkbox_value(self, key, field):
+		widget = getattr(field, "urwidget", None)
+		if widget is None:
+			return self.read_unbuilt_value(key, field)
+		return widget.get_state()
+
+	def read_radiolist_value(self, key, field):
+		if getattr(field, "urwidget", None) is None:
+			return self.read_unbuilt_value(key, field)
+		return field.selected
+
+	def read_option_list_value(self, key, field):
+		widget = getattr(field, "urwidget", None)
+		if widget is None:
+			return self.read_unbuilt_value(key, field)
+		return widget.get_value()
+
+	def read_table_value(self, key, field):
+		# The table holds the edited cells, with or without an editor.
+		return iter(self.get_table(key))
+
+	def read_textarea_value(self, key, field):
+		# The buffer holds the edited text, with or without a text area.
+		text_buffer = self.get_text_buffer(key)
+		return iter(text_buffer) if self.textarea_lines else text_buffer.text()
+
+	def read_checklist_values(self, key, field):
+		if getattr(field, "urwidget", None) is None:
+			return self.read_unbuilt_value(key, field)
+		return sorted(field.selected, key=field.selected.get)
+
+	def get_spec_value(self, key):
+		''' Return the value of a field as get_value would, but read it from widget_specs instead of from the widget. '''
 		widget_type = self.get_widget_type(key)
-		if (widget_type == "button"):
-			return self.get_button_value(key)
-		if (widget_type == "buttonrow"):
-			return self.get_buttonrow_value(key)
-		# The widgets below need a widget set to read its value. If no widget is stored (e.g. before creation of the form), return None now.
-		widget = self.get_widget(key)
-		if widget == None:
-			return None
-		# Continue the normal procedure for returning values here.
-		if (widget_type == "edit"):
-			return self.get_edit_value(key)
+		value = self.get_widget_value(key)
 		if (widget_type == "checkbox" or widget_type=="twocolcheckbox"):
-			return self.get_checkbox_value(key)
+			return bool(value)
 		if (widget_type == "radiolist"):
-			return self.get_radiolist_value(key)
+			selected = None
+			radio_values = self.ensure_radiobutton_state_values(value, "first True")
+			for index, (label, state) in enumerate(radio_values.items()):
+				# Mimic urwid.RadioButton: "first True" only selects the first button, a later True state wins.
+				if state == "first True":
+					state = (index == 0)
+				if state:
+					selected = label
+			return selected
 		if (widget_type == "checklist"):
-			return self.get_checklist_values(key)
-		# Default behaviour, return "value" from widget_specs dictionary.
-		return self.get_widget_value(key)
+			checkbox_values = self.ensure_radiobutton_state_values(value)
+			return [label for label, state in checkbox_values.items() if state]
+		if (widget_type == "bigradiolist" or widget_type == "bigchecklist"):
+			labels, selected = self.get_option_selection(key, widget_type == "bigchecklist")
+			if widget_type == "bigchecklist":
+				return [labels[position] for position in sorted(selected)]
+			return None if selected is None else labels[selected]
+		if (widget_type == "table"):
+			return iter(self.get_table(key))
+		if (widget_type == "textarea"):
+			return self.read_textarea_value(key, self.widget_specs[key])
+		return value
 
 	def get_button_value(self, key):
-		return self.button_pressed == key
+		return self.read_button_value(key, self.widget_specs[key])
 
 	def get_buttonrow_value(self, key):
-		return self.get_widget_result(key)
+		return self.read_buttonrow_value(key, self.widget_specs[key])
 
 	def get_edit_value(self, key):
-		return self.get_widget(key).get_edit_text()
+		return self.read_edit_value(key, self.widget_specs[key])
 
 	def get_checkbox_value(self, key):		
-		return self.get_widget(key).get_state()
+		return self.read_checkbox_value(key, self.widget_specs[key])
 
 	def get_checklist_values(self, key):
-		values = []
-		for a_checkbox in self.get_widget(key):
-			if a_checkbox.get_state():
-				values.append(a_checkbox.label)
-		return values
+		return self.read_checklist_values(key, self.widget_specs[key])
 
 	def get_radiolist_value(self, key):		
-		for a_radiobutton in self.get_widget(key):
-			if a_radiobutton.get_state():
-				return a_radiobutton.label
+		return self.read_radiolist_value(key, self.widget_specs[key])
 		
 	def add_ok_button(self):
 		self.listwalker.append(urwid.Divider())
@@ -387,20 +1940,32 @@ class Urwish(UrwishWidgetsBase):
 		else:
 			okbtn = urwid.Button(self.submit_button_caption)
 			list_widget = okbtn
+		self.ok_row = list_widget
 		## Tell the Urwid screen what to do on pressing OK
-		urwid.connect_signal(okbtn, 'click', self.ok_click)
+		urwid.connect_signal(okbtn, 'click', self.click_handler(self.ok_click))
 		self.listwalker.append(list_widget)
 
 	def buttonrow_click(self, button, widkey):
+		self.mark_changed(widkey)
 		self.set_widget_result(widkey, button.label)
-		raise urwid.ExitMainLoop()
+		self.finish()
 
 	def manual_button_click(self, button, widkey):
 		self.button_pressed = widkey
-		raise urwid.ExitMainLoop()
+		self.finish()
 
 	def ok_click(self, button):
 		self.button_pressed = "default"
+		self.finish()
+
+	def finish(self):
+		''' The form has been submitted: resolve the future when running with run_async, leave the MainLoop otherwise. '''
+		if self.journal is not None:
+			self.write_journal()
+		if self.future is not None:
+			if not self.future.done():
+				self.future.set_result(self)
+			return
 		raise urwid.ExitMainLoop()
 		
 	def get_line_len(self, description):
@@ -411,21 +1976,73 @@ class Urwish(UrwishWidgetsBase):
 			for an_item in description:
 				maxlen = max(maxlen, self.get_line_len(an_item))
 			return maxlen
-		# The "normal" routine, split at linebreaks, return longest line-string.
+		# The "normal" routine, split at linebreaks, return the display width of the longest line.
 		for a_line in description.splitlines():
-			maxlen = max(maxlen, len(a_line))
+			maxlen = max(maxlen, urwid.util.calc_width(a_line, 0, len(a_line)))
 		return maxlen
-		
+
+	def get_field_descr_width(self, key):
+		''' Return the width of the left column text of a field, or None if the field has no left column. '''
+		if self.get_widget_type(key) in self.twocol_types:
+			return self.get_line_len(self.widget_specs[key]["descr"])
+		if self.get_widget_type(key) == "button":
+			return self.get_line_len(self.button_firstcol_text(key))
+		return None
+
+	def measure_descr_width(self, key):
+		if self.fields_created:
+			self.track_descr_width(key)
+		else:
+			self.unmeasured_fields.append(key)
+
+	def track_descr_width(self, key):
+		width = self.get_field_descr_width(key)
+		self.descr_widths[key] = width
+		if width is not None:
+			self.descr_width_count[width] += 1
+
+	def forget_descr_width(self, key):
+		width = self.descr_widths.pop(key, None)
+		if width is not None:
+			self.descr_width_count[width] -= 1
+			if not self.descr_width_count[width]:
+				del self.descr_width_count[width]
+
 	def get_descr_col_width(self):
-		maxlen = len(self.submit_button_leftcol_text)
-		for widkey in self.widget_list:
-			if self.get_widget_type(widkey) in self.twocol_types:
-				maxlen = max(maxlen, self.get_line_len(self.widget_specs[widkey]["descr"]))
-			if self.get_widget_type(widkey) == "button":
-				maxlen = max(maxlen, self.get_line_len(self.button_firstcol_text(widkey)))
+		# The widths of the fields are tracked per field, only the distinct widths are compared here.
+		for key in self.unmeasured_fields:
+			if key in self.widget_specs and key not in self.descr_widths:
+				self.track_descr_width(key)
+		self.unmeasured_fields = []
+		maxlen = self.get_line_len(self.submit_button_leftcol_text)
+		if self.descr_width_count:
+			maxlen = max(maxlen, max(self.descr_width_count))
 		# Add 2 as a spacer between description and field.
 		return (maxlen + 2)
 
+	def update_descr_col_width(self):
+		''' Recalculate the width of the left column. If it changed, update the twocol rows that have been built. '''
+		descr_colwidth = self.get_descr_col_width()
+		if descr_colwidth == self.descr_colwidth:
+			return
+		self.descr_colwidth = descr_colwidth
+		for widkey, row in self.built_rows():
+			# The (empty) row of a hidden field is rebuilt at the current width when it is shown again.
+			if self.descr_widths.get(widkey) is not None and widkey not in self.hidden_fields:
+				self.relayout_twocol_row(row)
+		if self.ok_row is not None and self.submit_twocol:
+			self.relayout_twocol_row(self.ok_row)
+
+	def built_rows(self):
+		''' Yield (widget_key, row widget) for all rows that currently exist in the listwalker. '''
+		if self.lazy:
+			return list(self.listwalker.rows.items())
+		return zip(self.widget_list, self.listwalker)
+
+	def relayout_twocol_row(self, row):
+		''' Set the width of the left column of a row created by urwid_twocol_field to descr_colwidth. '''
+		row.contents[0] = (row.contents[0][0], row.options("given", self.descr_colwidth))
+
 	def final_list(self):
 		# Add all widgets to the form
 		self.create_fields()
@@ -434,12 +2051,533 @@ class Urwish(UrwishWidgetsBase):
 			self.add_ok_button()
 		# Reset button pressed value
 		self.button_pressed = None
-
+		# Fields set from the journal still differ from their default.
+		self.changed_fields = set(self.replayed_fields)
+		self.built = True
+
+	def reset(self):
+		''' Restore the default values of the fields changed since the form was built (or since the
+		    previous reset) and forget which button was pressed. Unchanged fields are not touched,
+		    so the time needed does not depend on the size of the form. '''
+		changed_fields = self.changed_fields
+		for widget_key in changed_fields:
+			if widget_key in self.widget_specs:
+				self.reset_field(widget_key)
+		# Restoring the widgets triggers their change signals, forget those.
+		self.changed_fields = set()
+		self.replayed_fields = set()
+		self.button_pressed = None
+		if len(self.listwalker):
+			self.listwalker.set_focus(0)
+
+	def reset_field(self, widget_key):
+		field = self.widget_specs[widget_key]
+		if "default" in field:
+			field.value = field.default
+		widget_type = field.type
+		if widget_type == "table":
+			# The table itself has been edited.
+			self.get_table(widget_key).restore()
+		elif widget_type == "textarea":
+			self.get_text_buffer(widget_key).restore()
+		if widget_type == "buttonrow":
+			field.res = None
+			return
+		widget = getattr(field, "urwidget", None)
+		if widget is None:
+			# Not built (or released by the lazy walker), it will be created using the restored value.
+			return
+		if widget_type == "edit":
+			widget.set_edit_text(field.value)
+			# Like a new Edit (see urwid_twocol_edit).
+			widget.set_edit_pos(0)
+		elif widget_type == "checkbox" or widget_type == "twocolcheckbox":
+			widget.set_state(bool(field.value))
+		elif widget_type == "radiolist" or widget_type == "checklist":
+			for a_button, state in zip(widget, self.get_spec_states(widget_key)):
+				a_button.set_state(state)
+		elif widget_type == "bigradiolist" or widget_type == "bigchecklist":
+			widget.set_selection(self.get_option_selection(widget_key, widget_type == "bigchecklist")[1])
+		elif widget_type == "table" or widget_type == "textarea":
+			widget.refresh()
+
+	def get_spec_states(self, key):
+		''' Return the states of the buttons of a radiolist or checklist according to its "value" in widget_specs. '''
+		if self.get_widget_type(key) == "radiolist":
+			selected = self.get_spec_value(key)
+			labels = self.ensure_radiobutton_state_values(self.get_widget_value(key), "first True")
+			return [label == selected for label in labels]
+		checkbox_values = self.ensure_radiobutton_state_values(self.get_widget_value(key))
+		return [bool(state) for state in checkbox_values.values()]
+
+	def fill(self, answers, plan=None):
+		''' Headless alternative to run: return the values of all fields (as values() would after a run)
+		    for a dictionary of answers by key, without creating any widgets. Answers are converted like
+		    the form would: see get_batch_converters. Fields without an answer get their default value. '''
+		if plan is None:
+			plan = self.compile_batch()
+		result = OrderedDict()
+		for key, default, convert in plan:
+			if convert is not None and key in answers:
+				result[key] = convert(answers[key])
+			elif isinstance(default, (UrwishTable, UrwishTextBuffer)):
+				# An iterator over the rows or lines, like get_value.
+				result[key] = iter(default)
+			else:
+				result[key] = default
+		return result
+
+	def run_batch(self, source, format=None):
+		''' Yield the result of fill for every record in source: an iterable of dictionaries, or an opened
+		    file of JSON lines or CSV records when format is "jsonl" or "csv" (see read_records). '''
+		if format is not None:
+			source = self.read_records(source, format)
+		plan = self.compile_batch()
+		for record in source:
+			yield self.fill(record, plan)
+
+	def compile_batch(self):
+		''' Prepare fill and run_batch: a list of (key, default value, converter) for all fields, in order.
+		    The converter (None for fields that take no answer) is created once per field. '''
+		converters = self.get_batch_converters()
+		plan = []
+		for key, field in self.widget_specs.items():
+			widget_type = field.type
+			if widget_type == "button":
+				default = False
+			elif widget_type == "buttonrow":
+				default = None
+			elif widget_type == "table":
+				# Not an iterator, which would be exhausted after the first record: fill iterates it.
+				default = self.get_table(key)
+			elif widget_type == "textarea" and self.textarea_lines:
+				default = self.get_text_buffer(key)
+			else:
+				default = self.get_spec_value(key)
+			create_converter = converters.get(widget_type)
+			plan.append((key, default, create_converter(key, field) if create_converter else None))
+		return plan
+
+	def get_batch_converters(self):
+		''' widget_type -> method(key, field) returning a function that converts an answer (e.g. a string
+		    from CSV) into the value get_value would return for that field. '''
+		return {
+			"edit": self.batch_text_converter,
+			"textarea": self.batch_textarea_converter,
+			"checkbox": self.batch_bool_converter,
+			"twocolcheckbox": self.batch_bool_converter,
+			"button": self.batch_bool_converter,
+			"radiolist": self.batch_choice_converter,
+			"bigradiolist": self.batch_choice_converter,
+			"buttonrow": self.batch_choice_converter,
+			"checklist": self.batch_multichoice_converter,
+			"bigchecklist": self.batch_multichoice_converter,
+		}
+
+	def get_option_labels(self, key):
+		''' The labels (as shown) of the options of a radiolist/checklist, or the captions of a buttonrow. '''
+		if self.get_widget_type(key) == "buttonrow":
+			return [str(caption) for caption in (self.get_widget_value(key) or self.get_widget_descr(key))]
+		return [str(label) for label in self.get_widget_value(key)]
+
+	def batch_text_converter(self, key, field):
+		def convert(answer):
+			return "" if answer is None else str(answer)
+		return convert
+
+	def batch_textarea_converter(self, key, field):
+		def convert(answer):
+			text = "" if answer is None else str(answer)
+			return iter(text.split("\n")) if self.textarea_lines else text
+		return convert
+
+	def batch_bool_converter(self, key, field):
+		true_strings = ("1", "true", "yes", "y", "on", "x")
+		false_strings = ("0", "false", "no", "n", "off", "")
+		def convert(answer):
+			if not isinstance(answer, str):
+				return bool(answer)
+			folded = answer.strip().lower()
+			if folded in true_strings:
+				return True
+			if folded in false_strings:
+				return False
+			raise ValueError("Not a boolean answer for Urwish field", key, answer)
+		return convert
+
+	def batch_choice_converter(self, key, field):
+		labels = set(self.get_option_labels(key))
+		# No answer (e.g. an empty CSV cell) leaves the selection of a radiolist as it is: like a
+		# field without an answer, as a shown radiolist always has a selection. Buttonrows give None.
+		default = None if field.type == "buttonrow" else self.get_spec_value(key)
+		def convert(answer):
+			if answer is None or answer == "":
+				return default
+			answer = str(answer)
+			if answer not in labels:
+				raise ValueError("Not an option of Urwish field", key, answer)
+			return answer
+		return convert
+
+	def batch_multichoice_converter(self, key, field):
+		positions = dict((label, position) for position, label in enumerate(self.get_option_labels(key)))
+		def convert(answer):
+			if answer is None:
+				return []
+			if isinstance(answer, str):
+				# The format of write_values: labels separated by ";"
+				answer = [label for label in answer.split(";") if label]
+			answer = [str(label) for label in answer]
+			for label in answer:
+				if label not in positions:
+					raise ValueError("Not an option of Urwish field", key, label)
+			return sorted(answer, key=positions.__getitem__)
+		return convert
+
+	def main_loop(self, event_loop=None):
+		loop = urwid.MainLoop(self.loop_widget(), palette=self.palette, screen=self.create_screen(),
+			event_loop=event_loop, input_filter=self.input_filter)
+		if self.bracketed_paste:
+			self.bracketed_paste_loop(loop)
+		self.watch_updates(loop)
+		if self.journal is not None:
+			loop.set_alarm_in(self.journal.sync_interval, self.journal_alarm)
+		return self.instrument_loop(loop)
 
 	def show(self):
-		urwid.MainLoop(self.window, palette=[('reversed', 'standout', 'dark cyan')]).run()
+		try:
+			self.main_loop().run()
+		finally:
+			self.unwatch_updates()
 		return self
 
 	def run(self):
 		self.final_list()
 		return self.show()
+
+	async def run_async(self):
+		''' Like run, but using urwid's asyncio event loop: returns when the form has been submitted,
+		    while other tasks on the running asyncio loop keep going. '''
+		self.final_list()
+		import asyncio
+		asyncio_loop = asyncio.get_running_loop()
+		loop = self.main_loop(event_loop=urwid.AsyncioEventLoop(loop=asyncio_loop))
+		self.future = asyncio_loop.create_future()
+		loop.start()
+		try:
+			await self.future
+		finally:
+			self.future = None
+			loop.stop()
+			self.unwatch_updates()
+		return self
+
+	def run_many(self, count=None, until=None):
+		''' Show the form for one record after another and yield the values (see values) of every
+		    submitted record. The widgets are built only once, in between records only the changed
+		    fields are reset (see reset). Stops after count records, or as soon as until(form) returns
+		    True for a submitted form (that record is not yielded). '''
+		if self.built:
+			self.reset()
+		else:
+			self.final_list()
+		loop = self.main_loop()
+		records = 0
+		try:
+			while count is None or records < count:
+				loop.run()
+				if until is not None and until(self):
+					return
+				records += 1
+				yield self.values()
+				self.reset()
+		finally:
+			self.unwatch_updates()
+
+
+class UrwishTemplate(object):
+	'''A form schema compiled by compile_schema: the keys, types,
+	   descriptions and values of the fields and the widths of their left
+	   column, ready to create forms from without validating or measuring
+	   anything. Templates are stored in files by load_schema, for later
+	   processes. The forms created share the values of the fields, which are
+	   never changed in place.'''
+
+	def __init__(self, title="", lazy=False, attributes=None, fields=None):
+		self.title = title
+		self.lazy = lazy
+		# Form attributes (see Urwish.define_attributes) set on the forms created.
+		self.attributes = attributes or {}
+		# A list of (key, widget_type, descr, value, width of the left column or None).
+		self.fields = fields or []
+
+	def __repr__(self):
+		return "UrwishTemplate(" + repr(self.title) + ", " + str(len(self.fields)) + " fields)"
+
+	def create_form(self):
+		''' Return a new Urwish form with the fields of the template. '''
+		form = Urwish(self.title, lazy=self.lazy)
+		for name, value in self.attributes.items():
+			setattr(form, name, value)
+		widget_specs = form.widget_specs
+		descr_widths = form.descr_widths
+		descr_width_count = form.descr_width_count
+		for key, widget_type, descr, value, width in self.fields:
+			widget_specs.append(key, UrwishField(descr, value, widget_type))
+			descr_widths[key] = width
+			if width is not None:
+				descr_width_count[width] += 1
+		return form
+
+	def save(self, filename):
+		''' Write the template to filename (in the format of the marshal module), replacing it by a rename. '''
+		tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+		with open(tmp_filename, 'wb') as outfile:
+			outfile.write(marshal.dumps((TEMPLATE_FORMAT, self.title, self.lazy, self.attributes, self.fields)))
+		os.replace(tmp_filename, filename)
+
+
+def read_template(filename):
+	''' Return the UrwishTemplate saved in filename, or None if there is none (of the current format). '''
+	try:
+		with open(filename, 'rb') as infile:
+			template_format, title, lazy, attributes, fields = marshal.loads(infile.read())
+	except (OSError, EOFError, ValueError, TypeError):
+		return None
+	if template_format != TEMPLATE_FORMAT:
+		return None
+	return UrwishTemplate(title, lazy, attributes, fields)
+
+
+def compile_schema(schema):
+	''' Validate a form schema (see load_schema) and compile it into an UrwishTemplate. Raises ValueError
+	    for the first problem found. '''
+	# Only JSON values, which is what schemas are made of (and what templates can store).
+	schema = json.loads(json.dumps(schema))
+	if not isinstance(schema, dict) or not isinstance(schema.get("fields"), list):
+		raise ValueError("Invalid Urwish schema", "A schema is a dictionary with a list of fields.")
+	unknown = set(schema) - set(("title", "lazy", "attributes", "fields"))
+	if unknown:
+		raise ValueError("Invalid Urwish schema", "Unknown entries", sorted(unknown))
+	form = Urwish(schema.get("title", ""), lazy=bool(schema.get("lazy", False)))
+	attributes = schema.get("attributes", {})
+	# Only the settings of define_attributes can be set, not the state of the form.
+	settings = object.__new__(Urwish)
+	settings.define_attributes()
+	for name, value in attributes.items():
+		if name not in settings.__dict__:
+			raise ValueError("Invalid Urwish schema", "Unknown form attribute", name)
+		setattr(form, name, value)
+	widget_types = form.get_createwidget_methods()
+	for position, field in enumerate(schema["fields"]):
+		widget_type, key, descr, value = check_schema_field(position, field, widget_types)
+		if key is not None and key in form.widget_specs:
+			raise ValueError("Invalid Urwish schema", "field " + str(position), "Duplicate key", key)
+		form.add_input(widget_type, key, descr, value)
+	fields = [(key, field.type, field.descr, field.value, form.get_field_descr_width(key))
+		for key, field in form.widget_specs.items()]
+	return UrwishTemplate(form.title, form.lazy, attributes, fields)
+
+
+def check_schema_field(position, field, widget_types):
+	''' Return (widget_type, key, descr, value) of a field of a schema, raise ValueError if it is not valid. '''
+	def invalid(*message):
+		return ValueError("Invalid Urwish schema", "field " + str(position), *message)
+	if not isinstance(field, dict):
+		raise invalid("A field is a dictionary with a type, and optionally a key, descr and value.")
+	unknown = set(field) - set(("type", "key", "descr", "value"))
+	if unknown:
+		raise invalid("Unknown entries", sorted(unknown))
+	widget_type = field.get("type")
+	if widget_type not in widget_types:
+		raise invalid("Unknown widget_type", widget_type, "Use one of", sorted(widget_types))
+	key = field.get("key")
+	if key is not None and not isinstance(key, str):
+		raise invalid("A key is a string", key)
+	descr = field.get("descr", "")
+	if not isinstance(descr, (str, list)):
+		raise invalid("A descr is a string (or a list of strings)", descr)
+	value = field.get("value", "")
+	if widget_type in ("radiolist", "checklist", "bigradiolist", "bigchecklist") and not isinstance(value, (list, dict)):
+		raise invalid("The value of a " + widget_type + " is a list of labels or a dictionary of labels and states", value)
+	if widget_type in ("edit", "textarea") and not isinstance(value, str):
+		raise invalid("The value of a " + widget_type + " is a string", value)
+	if widget_type == "buttonrow" and not isinstance(value, (list, str)):
+		raise invalid("The value of a buttonrow is a list of captions", value)
+	if widget_type == "table":
+		if not isinstance(value, dict) or "columns" not in value:
+			raise invalid("The value of a table is a dictionary with columns (and rows)", value)
+		try:
+			UrwishTable(value["columns"], value.get("rows"))
+		except (ValueError, TypeError) as error:
+			raise invalid("Invalid table", *error.args)
+	return widget_type, key, descr, value
+
+
+def load_schema(schema, cache_dir=None):
+	''' Return the UrwishTemplate (see create_form) of a form schema: a dictionary like
+	        {"title": "Order", "lazy": false, "attributes": {"submit_button_caption": "Send"},
+	         "fields": [{"type": "edit", "key": "name", "descr": "Name", "value": ""}, ...]}
+	    or the filename of a JSON file holding one. Compiled templates are kept for the rest of the
+	    process and, with cache_dir, in a file named by a hash of the schema, so later processes skip
+	    parsing, validating and measuring it. '''
+	# Imported here, it isn't needed by forms without a schema.
+	import hashlib
+	if isinstance(schema, str):
+		with open(schema, 'rb') as infile:
+			data = infile.read()
+	else:
+		# Keys are not sorted: the order of the options of a field (e.g. a radiolist given as a
+		# dictionary of labels) is the order in which they are shown.
+		data = json.dumps(schema).encode()
+	# Compiled templates depend on the template format and, using marshal, on the version of Python.
+	version = ("%d %d.%d\n" % ((TEMPLATE_FORMAT,) + tuple(sys.version_info[:2]))).encode()
+	schema_hash = hashlib.sha256(version + data).hexdigest()
+	template = compiled_templates.get(schema_hash)
+	if template is not None:
+		return template
+	filename = os.path.join(cache_dir, "urwish-" + schema_hash + ".template") if cache_dir else None
+	if filename is not None:
+		template = read_template(filename)
+	if template is None:
+		template = compile_schema(json.loads(data.decode()) if isinstance(schema, str) else schema)
+		if filename is not None:
+			try:
+				os.makedirs(cache_dir, exist_ok=True)
+				template.save(filename)
+			except OSError:
+				# The cache is an optimisation only.
+				pass
+	compiled_templates[schema_hash] = template
+	return template
+
+
+class UrwishSession(object):
+	'''Keeps a single urwid MainLoop (and so a single screen) open while
+	   showing a number of Urwish forms, e.g. the steps of a wizard. The
+	   window of each form is swapped into the running screen, so the
+	   terminal is initialised only once. Forms that have been shown before
+	   are not rebuilt.
+
+	   Use as a context manager and call show(form) for each form, or use
+	   run(forms) to go through a list of forms, where the back_keys and
+	   forward_keys move between the steps.'''
+
+	def __init__(self, palette=None, screen=None, event_loop=None):
+		# Pass an urwid.AsyncioEventLoop as event_loop to use show_async and run_async.
+		self.loop = urwid.MainLoop(urwid.SolidFill(), palette=palette or [], screen=screen,
+			event_loop=event_loop, unhandled_input=self.unhandled_input, input_filter=self.input_filter)
+		self.back_keys = ['meta left']
+		self.forward_keys = ['meta right']
+		# Set when a navigation key ended the form shown: "back", "forward" or None.
+		self.navigation = None
+		self.started = False
+		# The form shown, which handles pasted text (see Urwish.input_filter).
+		self.form = None
+		self.bracketed_paste = True
+		# While showing a form with show_async: resolved when the form is submitted or left.
+		self.future = None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+	def start(self):
+		if not self.started:
+			self.loop.start()
+			if self.bracketed_paste:
+				set_bracketed_paste_mode(self.loop.screen, True)
+			self.started = True
+
+	def stop(self):
+		if self.started:
+			if self.bracketed_paste:
+				set_bracketed_paste_mode(self.loop.screen, False)
+			self.loop.stop()
+			self.started = False
+		if self.form is not None:
+			self.form.unwatch_updates()
+
+	def swap_in(self, form):
+		if not form.built:
+			form.final_list()
+		self.navigation = None
+		if self.form is not None and self.form is not form:
+			# Changes queued for the previous form wait until it is shown again.
+			self.form.unwatch_updates()
+		self.form = form
+		if form.update_loop is not self.loop:
+			form.watch_updates(self.loop)
+		self.loop.screen.register_palette(form.palette)
+		self.loop.widget = form.loop_widget()
+		self.start()
+
+	def show(self, form):
+		''' Show form in the session's screen until it is submitted (or a navigation key is pressed). '''
+		self.swap_in(form)
+		# Submitting the form raises urwid.ExitMainLoop, which ends this run of the event loop only.
+		self.loop.event_loop.run()
+		return form
+
+	async def show_async(self, form):
+		''' Like show, but awaits the submission of the form on the running asyncio loop. '''
+		if not isinstance(self.loop.event_loop, urwid.AsyncioEventLoop):
+			raise ValueError("UrwishSession.show_async needs a session created with an urwid.AsyncioEventLoop.")
+		import asyncio
+		self.swap_in(form)
+		self.future = form.future = asyncio.get_running_loop().create_future()
+		try:
+			await self.future
+		finally:
+			self.future = form.future = None
+		return form
+
+	def run(self, forms):
+		''' Show the forms one after another, starting at the first. Submitting a form shows the next
+		    one; the back_keys return to the previous form, the forward_keys go to the next form if it
+		    has been shown before. Returns the list of forms. '''
+		forms = list(forms)
+		position = furthest = 0
+		with self:
+			while position < len(forms):
+				self.show(forms[position])
+				position, furthest = self.next_step(position, furthest)
+		return forms
+
+	async def run_async(self, forms):
+		''' Like run, using show_async. '''
+		forms = list(forms)
+		position = furthest = 0
+		with self:
+			while position < len(forms):
+				await self.show_async(forms[position])
+				position, furthest = self.next_step(position, furthest)
+		return forms
+
+	def next_step(self, position, furthest):
+		if self.navigation == "back":
+			position = max(0, position - 1)
+		elif self.navigation != "forward" or position < furthest:
+			position += 1
+		return position, max(furthest, position)
+
+	def input_filter(self, keys, raw):
+		if self.form is None:
+			return keys
+		return self.form.input_filter(keys, raw)
+
+	def unhandled_input(self, key):
+		if key in self.back_keys:
+			self.navigation = "back"
+		elif key in self.forward_keys:
+			self.navigation = "forward"
+		else:
+			return
+		if self.future is not None:
+			if not self.future.done():
+				self.future.set_result(None)
+			return
+		raise urwid.ExitMainLoop()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+###############################################################
+# Urwish lib by Joep Bos-Coenraad (github.com/JoepBC)
+# Benchmarks for building, reading and rendering urwish forms.
+###############################################################
+
+# Usage: python3 urwish_benchmark.py [--sizes 10,1000,100000] [--types edit,radiolist]
+#                                    [--lazy] [--output results.json] [--compare old.json]
+#                                    [--max-import-ms 100]
+# Every form holds a single widget type. The results are written as JSON
+# (one entry per widget type, form size and benchmark, in seconds), so the
+# output of two releases can be compared using --compare. The cold import
+# time of the urwish and stapps modules is measured in fresh interpreters;
+# with --max-import-ms the script fails when it exceeds the given bound.
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import urwid
+from urwish import Urwish
+
+try:
+	from urwid.display.raw import Screen as RawScreen
+except ImportError:
+	from urwid.raw_display import Screen as RawScreen
+
+# widget_type -> (description, value) used for every field of a form.
+FIELD_VALUES = {
+	"edit": ("Edit field", "Some text"),
+	"checkbox": ("Checkbox", True),
+	"twocolcheckbox": ("Checkbox", True),
+	"radiolist": ("Radiolist", ["beer", "wine", "coffee"]),
+	"checklist": ("Checklist", ["python", "Smalltalk", "C++"]),
+	"bigradiolist": ("Big radiolist", ["beer", "wine", "coffee"]),
+	"bigchecklist": ("Big checklist", ["python", "Smalltalk", "C++"]),
+	"table": ("Table", {"columns": ["name", ("active", "checkbox")], "rows": [["beer", True], ["wine", False]]}),
+	"textarea": ("Textarea", "Some text\non a few\nlines"),
+	"button": ("Button", "Click me"),
+	"buttonrow": ("", ["Fin", "End", "Schluss"]),
+	"text": ("Some text", ""),
+	"spacer": ("", ""),
+}
+
+SCREEN_SIZE = (80, 40)
+KEYPRESSES = 20
+IMPORT_RUNS = 5
+
+
+class BenchmarkScreen(object):
+	'''A raw_display screen writing to a buffer instead of the terminal,
+	   or (if the screen cannot be started here) plain widget rendering.'''
+
+	def __init__(self):
+		self.output = io.StringIO()
+		self.input = open(os.devnull)
+		self.screen = RawScreen(input=self.input, output=self.output)
+		try:
+			self.screen.start()
+		except Exception:
+			self.screen = None
+
+	def draw(self, widget):
+		canvas = widget.render(SCREEN_SIZE, focus=True)
+		if self.screen is not None:
+			self.screen.draw_screen(SCREEN_SIZE, canvas)
+
+	def close(self):
+		if self.screen is not None:
+			self.screen.stop()
+		self.input.close()
+
+
+def timed(function, *args):
+	start = time.perf_counter()
+	result = function(*args)
+	return time.perf_counter() - start, result
+
+
+def fill_form(widget_type, size, lazy):
+	wish = Urwish("Benchmark", lazy=lazy)
+	descr, value = FIELD_VALUES[widget_type]
+	for index in range(size):
+		wish.add_input(widget_type, "field" + str(index), descr, value)
+	return wish
+
+
+def read_all_values(wish):
+	for key in wish.widget_list:
+		wish.get_value(key)
+
+
+def render_keypresses(wish, screen):
+	for keypress in range(KEYPRESSES):
+		wish.window.keypress(SCREEN_SIZE, 'down')
+		screen.draw(wish.window)
+
+
+def benchmark_form(widget_type, size, lazy, screen):
+	results = {}
+	results["add_input"], wish = timed(fill_form, widget_type, size, lazy)
+	results["get_descr_col_width"], width = timed(wish.get_descr_col_width)
+	results["create_fields"], unused = timed(wish.create_fields)
+	results["final_list"], unused = timed(wish.final_list)
+	results["first_render"], unused = timed(screen.draw, wish.window)
+	keypresses_time, unused = timed(render_keypresses, wish, screen)
+	results["keypress_render"] = keypresses_time / KEYPRESSES
+	results["get_value_all"], unused = timed(read_all_values, wish)
+	results["values"], unused = timed(wish.values)
+	return results
+
+
+def run_benchmarks(sizes, widget_types, lazy=False, verbose=True):
+	screen = BenchmarkScreen()
+	results = []
+	try:
+		for widget_type in widget_types:
+			for size in sizes:
+				for benchmark, seconds in benchmark_form(widget_type, size, lazy, screen).items():
+					results.append({"widget_type": widget_type, "fields": size, "lazy": lazy,
+						"benchmark": benchmark, "seconds": seconds})
+					if verbose:
+						print("%-15s %7d %-20s %12.6f s" % (widget_type, size, benchmark, seconds))
+	finally:
+		screen.close()
+	return results
+
+
+def import_time(module_name, runs=IMPORT_RUNS):
+	''' Return the best wall time of importing module_name in a fresh interpreter (minus the time of
+	    starting that interpreter), and whether urwid got imported too. '''
+	here = os.path.dirname(os.path.abspath(__file__))
+	code = ("import sys, time; sys.path.insert(0, %r); start = time.perf_counter(); import %s; "
+		"print(time.perf_counter() - start, 'urwid' in sys.modules)") % (here, module_name)
+	best = None
+	for run in range(runs):
+		output = subprocess.check_output([sys.executable, "-c", code]).split()
+		seconds, urwid_imported = float(output[0]), output[1] == b"True"
+		best = seconds if best is None else min(best, seconds)
+	return best, urwid_imported
+
+
+def run_import_benchmarks(verbose=True):
+	results = []
+	for module_name in ("urwish", "stapps"):
+		seconds, urwid_imported = import_time(module_name)
+		results.append({"widget_type": "import", "fields": 0, "benchmark": module_name,
+			"seconds": seconds, "urwid_imported": urwid_imported})
+		if verbose:
+			print("%-15s %7s %-20s %12.6f s%s" % ("import", "", module_name, seconds,
+				" (imports urwid)" if urwid_imported else ""))
+	return results
+
+
+def result_key(result):
+	return (result["widget_type"], result["fields"], result.get("lazy", False), result["benchmark"])
+
+
+def compare_results(old_results, new_results):
+	''' Print the ratio new/old of the benchmarks present in both result lists. '''
+	old_seconds = dict((result_key(result), result["seconds"]) for result in old_results)
+	for result in new_results:
+		old = old_seconds.get(result_key(result))
+		if old:
+			print("%-15s %7d %-20s %8.2fx" % (result["widget_type"], result["fields"],
+				result["benchmark"], result["seconds"] / old))
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark urwish forms.")
+	parser.add_argument("--sizes", default="10,1000,100000", help="comma separated numbers of fields")
+	parser.add_argument("--types", default=",".join(FIELD_VALUES), help="comma separated widget types")
+	parser.add_argument("--lazy", action="store_true", help="build the forms with lazy=True")
+	parser.add_argument("--output", default="bench_output.json", help="JSON file to write the results to")
+	parser.add_argument("--compare", help="JSON file with earlier results to compare with")
+	parser.add_argument("--max-import-ms", type=float, help="fail when importing a module takes longer")
+	args = parser.parse_args(argv)
+
+	sizes = [int(size) for size in args.sizes.split(",")]
+	import_results = run_import_benchmarks()
+	results = import_results + run_benchmarks(sizes, args.types.split(","), lazy=args.lazy)
+	report = {
+		"python": platform.python_version(),
+		"urwid": getattr(urwid, "__version__", "unknown"),
+		"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"results": results,
+	}
+	with open(args.output, "w") as outfile:
+		json.dump(report, outfile, indent=1)
+	if args.compare:
+		with open(args.compare) as infile:
+			compare_results(json.load(infile)["results"], results)
+	if args.max_import_ms is not None:
+		for result in import_results:
+			if result["seconds"] * 1000 > args.max_import_ms:
+				sys.exit("Importing %s took %.1f ms, more than %.1f ms." % (result["benchmark"],
+					result["seconds"] * 1000, args.max_import_ms))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
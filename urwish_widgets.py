@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+
+###############################################################
+# Urwish lib by Joep Bos-Coenraad (github.com/JoepBC)
+# The urwid based widget classes used by urwish forms. This module
+#  is imported by urwish.py when a form is built.
+###############################################################
+
+
+import urwid
+import bisect
+import time
+from collections import OrderedDict
+
+__all__ = ['UrwishLazyWalker', 'UrwishOptionIndex', 'UrwishOptionWalker', 'UrwishOptionList', 'UrwishTableWalker',
+	'UrwishTableEditor', 'UrwishTextAreaWalker', 'UrwishTextArea', 'UrwishTimingWrap']
+
+
+class UrwishLazyWalker(urwid.ListWalker):
+	'''A ListWalker for (very) large forms. Instead of holding a widget for
+	   every field, the row widget of a field is only built (using the
+	   create_widget method of the form) when the ListBox asks for it. Once
+	   more than cache_size rows are alive, the rows that were shown least
+	   recently (i.e. the rows scrolled out of view, far from the focus) are
+	   released again. Their values are kept in the widget_specs of the form.
+	   Widgets appended to the walker (dividers, the OK button) are kept
+	   as-is and positioned after the field rows.'''
+
+	def __init__(self, form, contents=[], cache_size=256):
+		self.form = form
+		self.cache_size = cache_size
+		# The keys of the fields in the form, in order. Set by set_keys.
+		self.keys = []
+		# Static widgets, shown after the field rows.
+		self.extra = list(contents)
+		# The rows built so far: widget_key -> row widget, least recently shown first.
+		self.rows = OrderedDict()
+		self.focus = 0
+
+	def set_keys(self, keys):
+		self.keys = keys
+		self.focus = 0
+		self._modified()
+
+	def __len__(self):
+		return len(self.keys) + len(self.extra)
+
+	def __getitem__(self, position):
+		if position < 0:
+			raise IndexError(position)
+		if position >= len(self.keys):
+			return self.extra[position - len(self.keys)]
+		widget_key = self.keys[position]
+		row = self.rows.get(widget_key)
+		if row is None:
+			row = self.form.create_widget(widget_key)
+			self.rows[widget_key] = row
+			self.trim_cache()
+		else:
+			self.rows.move_to_end(widget_key)
+		return row
+
+	def __delitem__(self, index):
+		if index != slice(None):
+			raise IndexError("UrwishLazyWalker only supports removing all rows at once (del walker[:]).")
+		self.release_rows()
+		self.keys = []
+		self.extra = []
+		self.focus = 0
+		self._modified()
+
+	def append(self, widget):
+		self.extra.append(widget)
+		self._modified()
+
+	def field_inserted(self, position):
+		''' Called by the form after a key has been inserted in its (shared) list of keys. '''
+		if position <= self.focus and len(self.keys) > 1:
+			self.focus += 1
+		self._modified()
+
+	def field_removed(self, position, widget_key):
+		''' Called by the form after a key has been removed from its (shared) list of keys. '''
+		self.rows.pop(widget_key, None)
+		if position < self.focus:
+			self.focus -= 1
+		self.focus = max(0, min(self.focus, len(self) - 1))
+		self._modified()
+
+	def field_changed(self, widget_key):
+		''' Drop the row of a field, so it will be recreated from widget_specs when shown. '''
+		if self.rows.pop(widget_key, None) is not None:
+			self._modified()
+
+	def focus_key(self):
+		if self.focus < len(self.keys):
+			return self.keys[self.focus]
+		return None
+
+	def trim_cache(self):
+		''' Release the least recently shown rows until no more than cache_size rows are alive. The row in focus is never released. '''
+		focus_key = self.focus_key()
+		while len(self.rows) > self.cache_size:
+			widget_key = next(iter(self.rows))
+			if widget_key == focus_key:
+				if len(self.rows) == 1:
+					return
+				self.rows.move_to_end(widget_key)
+				continue
+			self.release_row(widget_key)
+
+	def release_row(self, widget_key):
+		del self.rows[widget_key]
+		self.form.release_widget(widget_key)
+
+	def release_rows(self):
+		for widget_key in list(self.rows):
+			self.release_row(widget_key)
+
+	def set_focus(self, position):
+		self.focus = position
+		self._modified()
+
+	def next_position(self, position):
+		if position + 1 >= len(self):
+			raise IndexError(position)
+		return position + 1
+
+	def prev_position(self, position):
+		if position <= 0:
+			raise IndexError(position)
+		return position - 1
+
+	def positions(self, reverse=False):
+		if reverse:
+			return range(len(self) - 1, -1, -1)
+		return range(len(self))
+
+
+class UrwishOptionIndex(object):
+	'''Search index over the labels of a (large) list of options, built
+	   once per field. search(query) returns the positions of the matching
+	   labels (case insensitive): the labels starting with the query first
+	   (found by bisection in a sorted copy of the labels), followed by the
+	   other labels containing it. When the query extends the previous query,
+	   only the previous matches are scanned again.'''
+
+	def __init__(self, labels):
+		self.folded = [label.lower() for label in labels]
+		self.sorted = sorted((folded, position) for position, folded in enumerate(self.folded))
+		self.sorted_keys = [folded for folded, position in self.sorted]
+		self.last_query = ""
+		self.last_matches = range(len(self.folded))
+
+	def prefix_matches(self, query):
+		start = bisect.bisect_left(self.sorted_keys, query)
+		end = bisect.bisect_left(self.sorted_keys, query + "\U0010ffff", start)
+		return [position for folded, position in self.sorted[start:end]]
+
+	def search(self, query):
+		query = query.lower()
+		if not query:
+			self.last_query, self.last_matches = "", range(len(self.folded))
+			return self.last_matches
+		candidates = range(len(self.folded))
+		if self.last_query and query.startswith(self.last_query):
+			candidates = self.last_matches
+		folded = self.folded
+		matches = [position for position in candidates if query in folded[position]]
+		self.last_query, self.last_matches = query, matches
+		prefix_matches = self.prefix_matches(query)
+		if len(prefix_matches) == len(matches):
+			return prefix_matches
+		return prefix_matches + [position for position in matches if not folded[position].startswith(query)]
+
+
+class UrwishOptionWalker(urwid.ListWalker):
+	'''ListWalker over the matching options of an UrwishOptionList. Only the
+	   rows asked for by the ListBox (the visible ones) are built.'''
+
+	def __init__(self, option_list, cache_size=128):
+		self.option_list = option_list
+		self.cache_size = cache_size
+		self.matches = []
+		self.rows = {}
+		self.focus = 0
+
+	def set_matches(self, matches):
+		self.matches = matches
+		self.focus = 0
+		self.refresh()
+
+	def refresh(self):
+		''' Forget the rows, they will be rebuilt with the current selection when shown. '''
+		self.rows = {}
+		self._modified()
+
+	def __len__(self):
+		return len(self.matches)
+
+	def __getitem__(self, position):
+		if position < 0 or position >= len(self.matches):
+			raise IndexError(position)
+		row = self.rows.get(position)
+		if row is None:
+			if len(self.rows) >= self.cache_size:
+				self.rows = {}
+			row = self.rows[position] = self.option_list.create_row(self.matches[position])
+		return row
+
+	def set_focus(self, position):
+		self.focus = position
+		self._modified()
+
+	def next_position(self, position):
+		if position + 1 >= len(self.matches):
+			raise IndexError(position)
+		return position + 1
+
+	def prev_position(self, position):
+		if position <= 0:
+			raise IndexError(position)
+		return position - 1
+
+	def positions(self, reverse=False):
+		if reverse:
+			return range(len(self.matches) - 1, -1, -1)
+		return range(len(self.matches))
+
+
+class UrwishOptionList(urwid.WidgetWrap):
+	'''A list of (many) options, shown in a scrollable box of a fixed height
+	   with a filter field on top. Typing filters the options (see
+	   UrwishOptionIndex). Only the visible options get a widget, the
+	   selection is stored as option positions: a set when multiple options
+	   may be selected (checklist), a single position or None otherwise
+	   (radiolist). Emits 'change' when the selection changes.'''
+	signals = ['change']
+
+	def __init__(self, labels, selected, multiple=False, height=8, filter_caption="Filter: "):
+		self.labels = labels
+		self.multiple = multiple
+		self.selected = selected
+		# Built on first use of the filter
+		self.index = None
+		self.filter_edit = urwid.Edit(filter_caption)
+		urwid.connect_signal(self.filter_edit, 'postchange', self.filter_change)
+		self.walker = UrwishOptionWalker(self)
+		self.walker.set_matches(range(len(labels)))
+		self.pile = urwid.Pile([self.filter_edit, urwid.BoxAdapter(urwid.ListBox(self.walker), height)])
+		if labels:
+			self.pile.focus_position = 1
+		urwid.WidgetWrap.__init__(self, self.pile)
+
+	def create_row(self, position):
+		if self.multiple:
+			row = urwid.CheckBox(self.labels[position], position in self.selected)
+		else:
+			# A group of its own: the other options are updated by refreshing the walker.
+			row = urwid.RadioButton([], self.labels[position], position == self.selected)
+		urwid.connect_signal(row, 'change', self.row_change, position)
+		return row
+
+	def row_change(self, row, new_state, position):
+		if self.multiple:
+			if new_state:
+				self.selected.add(position)
+			else:
+				self.selected.discard(position)
+		elif new_state:
+			self.selected = position
+			self.walker.refresh()
+		elif self.selected == position:
+			self.selected = None
+		self._emit('change', position)
+
+	def set_selection(self, selected):
+		self.selected = selected
+		self.walker.refresh()
+
+	def filter_change(self, edit, old_text):
+		if self.index is None:
+			self.index = UrwishOptionIndex(self.labels)
+		self.walker.set_matches(self.index.search(edit.get_edit_text()))
+
+	def keypress(self, size, key):
+		# Typing in the list of options goes to the filter.
+		if self.pile.focus_position == 1 and (key == 'backspace' or (len(key) == 1 and key != ' ' and key.isprintable())):
+			self.pile.focus_position = 0
+		return self.pile.keypress(size, key)
+
+	def get_value(self):
+		if self.multiple:
+			return [self.labels[position] for position in sorted(self.selected)]
+		if self.selected is None:
+			return None
+		return self.labels[self.selected]
+
+	def get_states(self):
+		if self.multiple:
+			return [position in self.selected for position in range(len(self.labels))]
+		return [position == self.selected for position in range(len(self.labels))]
+
+
+class UrwishTableWalker(urwid.ListWalker):
+	'''ListWalker over the rows of an UrwishTableEditor. Only the rows asked
+	   for by the ListBox (the visible ones) get widgets, the cells are
+	   written to the table as they are edited.'''
+
+	def __init__(self, editor, cache_size=128):
+		self.editor = editor
+		self.cache_size = cache_size
+		self.rows = {}
+		self.focus = 0
+
+	def refresh(self):
+		''' Forget the rows, they will be rebuilt from the table when shown. '''
+		self.rows = {}
+		self._modified()
+
+	def __len__(self):
+		return len(self.editor.table)
+
+	def __getitem__(self, position):
+		if position < 0 or position >= len(self):
+			raise IndexError(position)
+		row = self.rows.get(position)
+		if row is None:
+			if len(self.rows) >= self.cache_size:
+				# Keep the row being edited.
+				focus_row = self.rows.get(self.focus)
+				self.rows = {} if focus_row is None else {self.focus: focus_row}
+			row = self.rows[position] = self.editor.create_row(position)
+		return row
+
+	def set_focus(self, position):
+		self.focus = position
+		self._modified()
+
+	def next_position(self, position):
+		if position + 1 >= len(self):
+			raise IndexError(position)
+		return position + 1
+
+	def prev_position(self, position):
+		if position <= 0:
+			raise IndexError(position)
+		return position - 1
+
+	def positions(self, reverse=False):
+		if reverse:
+			return range(len(self) - 1, -1, -1)
+		return range(len(self))
+
+
+class UrwishTableEditor(urwid.WidgetWrap):
+	'''Editor for the rows of an UrwishTable: a header with the column
+	   names above a scrollable box of a fixed height, with an Edit or a
+	   CheckBox per cell. Pressing insert adds an empty row below the row in
+	   focus (or a first row in an empty table). Emits 'change' with the
+	   position of the row when a cell or the number of rows changes.'''
+	signals = ['change']
+
+	def __init__(self, table, height=12):
+		self.table = table
+		# The width of checkbox columns, edit columns share the remaining width.
+		self.widths = [max(4, urwid.util.calc_width(name, 0, len(name)) + 1) if cell_type == "checkbox" else None
+			for name, cell_type in table.columns]
+		header = self.layout([urwid.Text(name, wrap='clip') for name in table.names])
+		self.walker = UrwishTableWalker(self)
+		self.listbox = urwid.ListBox(self.walker)
+		self.pile = urwid.Pile([header, urwid.BoxAdapter(self.listbox, height)])
+		self.pile.focus_position = 1
+		urwid.WidgetWrap.__init__(self, self.pile)
+
+	def layout(self, cells):
+		return urwid.Columns([cell if width is None else (width, cell) for width, cell in zip(self.widths, cells)], dividechars=1)
+
+	def create_row(self, position):
+		cells = []
+		for column, ((name, cell_type), value) in enumerate(zip(self.table.columns, self.table[position])):
+			if cell_type == "checkbox":
+				cell = urwid.CheckBox("", value)
+				urwid.connect_signal(cell, 'postchange', self.checkbox_change, (position, column))
+			else:
+				cell = urwid.Edit("", value)
+				urwid.connect_signal(cell, 'postchange', self.edit_change, (position, column))
+			cells.append(urwid.AttrMap(cell, None, focus_map='reversed'))
+		return self.layout(cells)
+
+	def edit_change(self, edit, old_text, position_column):
+		self.cell_change(position_column, edit.get_edit_text())
+
+	def checkbox_change(self, checkbox, old_state, position_column):
+		self.cell_change(position_column, checkbox.get_state())
+
+	def cell_change(self, position_column, value):
+		position, column = position_column
+		self.table.set_cell(position, column, value)
+		self._emit('change', position)
+
+	def insert_row(self):
+		position = self.walker.focus + 1 if len(self.table) else 0
+		self.table.insert(position)
+		self.walker.refresh()
+		self.listbox.set_focus(position)
+		self._emit('change', position)
+
+	def refresh(self):
+		self.walker.focus = min(self.walker.focus, max(0, len(self.table) - 1))
+		self.walker.refresh()
+
+	def keypress(self, size, key):
+		key = self.pile.keypress(size, key)
+		if key == 'insert':
+			self.insert_row()
+			return None
+		return key
+
+
+class UrwishTextAreaWalker(UrwishTableWalker):
+	'''ListWalker over the lines of an UrwishTextArea, only the lines shown
+	   by the ListBox get an Edit.'''
+
+	def __len__(self):
+		return len(self.editor.text_buffer)
+
+
+class UrwishTextArea(urwid.WidgetWrap):
+	'''Editor for the text of an UrwishTextBuffer: a scrollable box of a
+	   fixed height with an Edit per line on screen. Enter splits the line
+	   at the cursor, backspace at the start and delete at the end of a line
+	   join it with the line before or after. Emits 'change' with the
+	   position of the line when the text changes.'''
+	signals = ['change']
+
+	def __init__(self, text_buffer, height=8):
+		self.text_buffer = text_buffer
+		self.walker = UrwishTextAreaWalker(self)
+		self.listbox = urwid.ListBox(self.walker)
+		urwid.WidgetWrap.__init__(self, urwid.BoxAdapter(self.listbox, height))
+
+	def create_row(self, position):
+		line = urwid.Edit("", self.text_buffer[position], edit_pos=0)
+		urwid.connect_signal(line, 'postchange', self.line_change, position)
+		return line
+
+	def line_change(self, line, old_text, position):
+		self.text_buffer.set_line(position, line.get_edit_text())
+		self._emit('change', position)
+
+	def cursor(self):
+		''' Return the position of the line in focus and the column of the cursor in it. '''
+		position = self.walker.focus
+		return position, self.walker[position].edit_pos
+
+	def move_cursor(self, position, column):
+		self.walker.refresh()
+		# Not ListBox.set_focus, which moves the cursor to the column of the line in focus before.
+		self.walker.set_focus(position)
+		self.walker[position].set_edit_pos(column)
+		self._emit('change', position)
+
+	def insert_text(self, text):
+		''' Insert text (e.g. pasted, with newlines) at the cursor as a whole. '''
+		position, column = self.cursor()
+		self.move_cursor(*self.text_buffer.insert_text(position, column, text))
+
+	def refresh(self):
+		self.walker.focus = min(self.walker.focus, len(self.text_buffer) - 1)
+		self.walker.refresh()
+
+	def keypress(self, size, key):
+		position, column = self.cursor()
+		if key == 'enter':
+			self.text_buffer.split_line(position, column)
+			self.move_cursor(position + 1, 0)
+			return None
+		if key == 'backspace' and column == 0 and position > 0:
+			column = len(self.text_buffer[position - 1])
+			self.text_buffer.join_lines(position - 1)
+			self.move_cursor(position - 1, column)
+			return None
+		if key == 'delete' and column == len(self.text_buffer[position]) and position + 1 < len(self.text_buffer):
+			self.text_buffer.join_lines(position)
+			self.move_cursor(position, column)
+			return None
+		return self._w.keypress(size, key)
+
+
+class UrwishTimingWrap(urwid.WidgetWrap):
+	'''Wraps the window of a form with stats enabled, to record the time
+	   needed to handle each keypress and to render the window.'''
+
+	def __init__(self, widget, stats):
+		self.stats = stats
+		urwid.WidgetWrap.__init__(self, widget)
+
+	def keypress(self, size, key):
+		start = time.perf_counter()
+		try:
+			return self._w.keypress(size, key)
+		finally:
+			self.stats.record("keypress", time.perf_counter() - start)
+
+	def render(self, size, focus=False):
+		start = time.perf_counter()
+		canvas = self._w.render(size, focus=focus)
+		self.stats.record("render", time.perf_counter() - start)
+		return canvas